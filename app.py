@@ -1,14 +1,47 @@
 import streamlit as st
 import os
+import time
 import shutil
-from utils import logger, compute_file_hash, clean_filename
+import difflib
+from utils import logger, clean_filename, persist_upload
 from chat_logic import RAGChatbot
-from ingestion import NetworkConfigParser
+from ingestion import NetworkConfigParser, IngestionEngine
 
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
 
+# Canned comparison prompts (filled with the uploaded file names)
+DEEP_COMPARE_TEMPLATE = (
+    "Compare the candidate configuration '{c}' "
+    "against the golden configuration '{g}'. "
+    "Provide a detailed analysis of differences in: "
+    "1. VLANs "
+    "2. Interfaces "
+    "3. Routing Protocols "
+    "4. Security ACLs "
+    "5. QoS & Management. "
+    "Highlight missing or extra configurations in the candidate file."
+)
+
+QUICK_DIFF_TEMPLATE = (
+    "Compare '{c}' against '{g}'. "
+    "Produce a **Markdown Table** only. No summary text.\n"
+    "Columns: | Feature/Line | Golden Config | Candidate Status |\n"
+    "Rules for 'Candidate Status':\n"
+    "- ✅ MATCH\n"
+    "- ❌ MISSING\n"
+    "- ➕ EXTRA\n"
+    "- ⚠️ DIFF: <Show value>\n"
+    "Focus on VLANs, Interfaces, Routes, QoS, ACLs, and Management."
+)
+
+# Deep Compare answers with a plain line diff (no LLM) below this many diff lines
+DIFF_SHORT_CIRCUIT_LINES = 200
+
+# Streamed deep-compare output is re-rendered at most this often (seconds)
+STREAM_RENDER_INTERVAL = 0.05
+
 st.set_page_config(
     page_title="NOC Copilot Config Compare",
     page_icon="📡",
@@ -78,11 +111,55 @@ CUSTOM_CSS = """
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
-# Session State Initialization
+# Shared Resources (one per process, reused across reruns and sessions)
 # -----------------------------------------------------------------------------
 
-if "chatbot" not in st.session_state:
-    st.session_state.chatbot = RAGChatbot()
+@st.cache_resource(show_spinner=False)
+def get_ingestion_engine() -> IngestionEngine:
+    """Loads the embedding model and opens the vector store exactly once."""
+    return IngestionEngine()
+
+@st.cache_resource(show_spinner=False)
+def get_chatbot(model_name: str) -> RAGChatbot:
+    """One chatbot per LLM backend, all sharing the same ingestion engine."""
+    return RAGChatbot(model_name, ingestion=get_ingestion_engine())
+
+@st.cache_data(show_spinner=False)
+def parse_cached(file_path: str, file_hash: str, filename: str) -> list:
+    """
+    Parses an uploaded config into ConfigBlocks, memoized per content hash.
+    `file_hash` is the cache key, so a new upload invalidates automatically.
+    """
+    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        content = f.read()
+    return NetworkConfigParser(content, filename).parse()
+
+def config_diff(golden_path: str, golden_hash: str, golden_name: str,
+                candidate_path: str, candidate_hash: str, candidate_name: str) -> list:
+    """Unified diff of the parsed (redacted) configs, reusing the parse cache."""
+    golden_blocks = parse_cached(golden_path, golden_hash, golden_name)
+    candidate_blocks = parse_cached(candidate_path, candidate_hash, candidate_name)
+    golden_lines = "\n".join(b.full_text for b in golden_blocks).splitlines()
+    candidate_lines = "\n".join(b.full_text for b in candidate_blocks).splitlines()
+    return list(difflib.unified_diff(
+        golden_lines, candidate_lines,
+        fromfile=golden_name, tofile=candidate_name, lineterm=""
+    ))
+
+def render_sources(docs) -> str:
+    """Fuses all citations into one Markdown string (one widget instead of 2 per chunk)."""
+    parts = []
+    for doc in docs:
+        meta = doc.metadata
+        parts.append(
+            f"**{meta.get('source', 'Unknown')}** (Line {meta.get('line_start')}-{meta.get('line_end')})\n"
+            f"```text\n{doc.page_content}\n```"
+        )
+    return "\n\n".join(parts)
+
+# -----------------------------------------------------------------------------
+# Session State Initialization
+# -----------------------------------------------------------------------------
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -101,9 +178,10 @@ with st.sidebar:
         index=0
     )
     
-    if selected_model != st.session_state.chatbot.model_name:
-        st.session_state.chatbot.update_model(selected_model)
+    chatbot = get_chatbot(selected_model)
+    if st.session_state.get("model_name") not in (None, selected_model):
         st.toast(f"Switched to {selected_model}")
+    st.session_state["model_name"] = selected_model
 
     st.markdown("---")
     st.markdown("---")
@@ -114,70 +192,60 @@ with st.sidebar:
     golden_file = st.file_uploader("Upload Golden Config", type=['txt', 'pdf', 'cfg', 'log'], key="golden_uploader")
     
     if golden_file:
-        file_bytes = golden_file.getvalue()
-        file_hash = compute_file_hash(file_bytes)
-        
-        # Simple local save mechanics
-        upload_dir = "./uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        # Content-addressed save: identical bytes are only written once
+        save_path, file_hash = persist_upload(golden_file)
         safe_name = clean_filename(golden_file.name)
-        save_path = os.path.join(upload_dir, safe_name)
         
-        # Check if already processed
-        if f"processed_golden_{file_hash}" not in st.session_state:
-            with open(save_path, "wb") as f:
-                f.write(file_bytes)
-            
+        # Re-indexed only when the store doesn't hold this version: a later upload
+        # under the same name, from this or another session, may have replaced it.
+        # One metadata lookup, so reruns stay cheap.
+        first_time = f"processed_golden_{file_hash}" not in st.session_state
+        success = True
+        if chatbot.ingestion.get_file_hash(safe_name, "golden") != file_hash:
             with st.spinner("Indexing Golden Config..."):
-                success = st.session_state.chatbot.process_file(save_path, extra_metadata={"config_role": "golden"})
-                if success:
-                    st.session_state[f"processed_golden_{file_hash}"] = True
-                    st.session_state["golden_name"] = golden_file.name
-                    st.session_state["golden_filename_clean"] = safe_name # Store sanitized name
-                    st.session_state["golden_hash"] = file_hash # Store Hash
-                    st.success("✅ Golden Config Indexed!")
-                else:
-                    st.error("Failed to process file.")
-        else:
-            st.info("✅ Golden Config Ready")
+                success = chatbot.process_file(save_path, extra_metadata={"config_role": "golden"}, filename=safe_name)
+        if success:
+            st.session_state[f"processed_golden_{file_hash}"] = True
             st.session_state["golden_name"] = golden_file.name
-            st.session_state["golden_filename_clean"] = safe_name
-            st.session_state["golden_hash"] = file_hash
+            st.session_state["golden_filename_clean"] = safe_name # Store sanitized name
+            st.session_state["golden_hash"] = file_hash # Store Hash
+            st.session_state["golden_path"] = save_path # Canonical upload path
+            if first_time:
+                st.success("✅ Golden Config Indexed!")
+            else:
+                st.info("✅ Golden Config Ready")
+        else:
+            st.error("Failed to process file.")
 
     # Candidate Config Uploader
     st.markdown("#### 2. Candidate Config (Target)")
     candidate_file = st.file_uploader("Upload Candidate Config", type=['txt', 'pdf', 'cfg', 'log'], key="candidate_uploader")
 
     if candidate_file:
-        file_bytes = candidate_file.getvalue()
-        file_hash = compute_file_hash(file_bytes)
-        
-        # Simple local save mechanics
-        upload_dir = "./uploads"
-        os.makedirs(upload_dir, exist_ok=True)
+        # Content-addressed save: identical bytes are only written once
+        save_path, file_hash = persist_upload(candidate_file)
         safe_name = clean_filename(candidate_file.name)
-        save_path = os.path.join(upload_dir, safe_name)
         
-        # Check if already processed
-        if f"processed_candidate_{file_hash}" not in st.session_state:
-            with open(save_path, "wb") as f:
-                f.write(file_bytes)
-            
+        # Re-indexed only when the store doesn't hold this version: a later upload
+        # under the same name, from this or another session, may have replaced it.
+        # One metadata lookup, so reruns stay cheap.
+        first_time = f"processed_candidate_{file_hash}" not in st.session_state
+        success = True
+        if chatbot.ingestion.get_file_hash(safe_name, "candidate") != file_hash:
             with st.spinner("Indexing Candidate Config..."):
-                success = st.session_state.chatbot.process_file(save_path, extra_metadata={"config_role": "candidate"})
-                if success:
-                    st.session_state[f"processed_candidate_{file_hash}"] = True
-                    st.session_state["candidate_name"] = candidate_file.name
-                    st.session_state["candidate_filename_clean"] = safe_name # Store sanitized name
-                    st.session_state["candidate_hash"] = file_hash # Store Hash
-                    st.success("✅ Candidate Config Indexed!")
-                else:
-                    st.error("Failed to process file.")
-        else:
-            st.info("✅ Candidate Config Ready")
+                success = chatbot.process_file(save_path, extra_metadata={"config_role": "candidate"}, filename=safe_name)
+        if success:
+            st.session_state[f"processed_candidate_{file_hash}"] = True
             st.session_state["candidate_name"] = candidate_file.name
-            st.session_state["candidate_filename_clean"] = safe_name
-            st.session_state["candidate_hash"] = file_hash
+            st.session_state["candidate_filename_clean"] = safe_name # Store sanitized name
+            st.session_state["candidate_hash"] = file_hash # Store Hash
+            st.session_state["candidate_path"] = save_path # Canonical upload path
+            if first_time:
+                st.success("✅ Candidate Config Indexed!")
+            else:
+                st.info("✅ Candidate Config Ready")
+        else:
+            st.error("Failed to process file.")
 
     st.markdown("---")
     
@@ -186,36 +254,22 @@ with st.sidebar:
     with col1:
         if st.button("⚖️ Deep Compare", disabled=not (golden_file and candidate_file), use_container_width=True):
             if "golden_name" in st.session_state and "candidate_name" in st.session_state:
-                prompt = (
-                    f"Compare the candidate configuration '{st.session_state['candidate_name']}' "
-                    f"against the golden configuration '{st.session_state['golden_name']}'. "
-                    "Provide a detailed analysis of differences in: "
-                    "2. Interfaces "
-                    "3. Routing Protocols "
-                    "4. Security ACLs "
-                    "5. QoS & Management. "
-                    "Highlight missing or extra configurations in the candidate file."
-                    "Highlight missing or extra configurations in the candidate file."
+                prompt = DEEP_COMPARE_TEMPLATE.format(
+                    c=st.session_state['candidate_name'],
+                    g=st.session_state['golden_name']
                 )
+                # History renders below in this same run; no st.rerun() needed
                 st.session_state.messages.append({"role": "user", "content": prompt})
-                st.rerun()
 
     with col2:
         if st.button("⚡ Quick Diff", disabled=not (golden_file and candidate_file), use_container_width=True):
              if "golden_name" in st.session_state and "candidate_name" in st.session_state:
-                prompt = (
-                    f"Compare '{st.session_state['candidate_name']}' against '{st.session_state['golden_name']}'. "
-                    "Produce a **Markdown Table** only. No summary text.\n"
-                    "Columns: | Feature/Line | Golden Config | Candidate Status |\n"
-                    "Rules for 'Candidate Status':\n"
-                    "- ✅ MATCH\n"
-                    "- ❌ MISSING\n"
-                    "- ➕ EXTRA\n"
-                    "- ⚠️ DIFF: <Show value>\n"
-                    "Focus on VLANs, Interfaces, Routes, QoS, ACLs, and Management."
+                prompt = QUICK_DIFF_TEMPLATE.format(
+                    c=st.session_state['candidate_name'],
+                    g=st.session_state['golden_name']
                 )
+                # History renders below in this same run; no st.rerun() needed
                 st.session_state.messages.append({"role": "user", "content": prompt})
-                st.rerun()
 
     st.markdown("---")
     
@@ -235,20 +289,19 @@ with st.sidebar:
             target_file_name = None
             if inspect_target == "Golden Config":
                 target_file_name = st.session_state.get("golden_filename_clean")
+                file_path = st.session_state.get("golden_path")
+                target_hash = st.session_state.get("golden_hash")
             else:
                 target_file_name = st.session_state.get("candidate_filename_clean")
+                file_path = st.session_state.get("candidate_path")
+                target_hash = st.session_state.get("candidate_hash")
             
             if target_file_name:
-                file_path = os.path.join("./uploads", target_file_name)
-                if os.path.exists(file_path):
+                if file_path and os.path.exists(file_path):
                     with st.spinner(f"Parsing {target_file_name}..."):
                         try:
-                            # Re-read and re-parse on demand for inspection
-                            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                                content = f.read()
-                            
-                            parser = NetworkConfigParser(content, target_file_name)
-                            blocks = parser.parse()
+                            # Parsed once per content hash, then served from cache
+                            blocks = parse_cached(file_path, target_hash, target_file_name)
                             
                             st.markdown(f"**Found {len(blocks)} chunks in `{target_file_name}`**")
                             
@@ -282,19 +335,25 @@ st.title("Network Assistant")
 st.caption("Ask questions about your uploaded Cisco/Aruba configurations.")
 
 # Display Chat History
-for msg in st.session_state.messages:
-    with st.chat_message(msg["role"]):
-        st.markdown(msg["content"])
-        if "citations" in msg and msg["citations"]:
-            with st.expander("📚 Sources"):
-                for doc in msg["citations"]:
-                    st.markdown(f"**{doc.metadata.get('source', 'Unknown')}** (Line {doc.metadata.get('line_start')}-{doc.metadata.get('line_end')})")
-                    st.code(doc.page_content, language="text")
+@st.fragment
+def render_history():
+    """History lives in its own fragment so interactions inside it don't rerun the app."""
+    for msg in st.session_state.messages:
+        with st.chat_message(msg["role"]):
+            st.markdown(msg["content"])
+            if "citations" in msg and msg["citations"]:
+                with st.expander("📚 Sources"):
+                    # Pre-rendered when the answer was generated; no per-doc loop on reruns
+                    st.markdown(msg.get("citations_rendered") or render_sources(msg["citations"]))
+
+render_history()
 
 # Chat Input
 if prompt := st.chat_input("Ex: What VLANs are configured on the core switch?"):
     st.session_state.messages.append({"role": "user", "content": prompt})
-    st.rerun()
+    # Render inline and answer in the same script run (no rerun round-trip)
+    with st.chat_message("user"):
+        st.markdown(prompt)
 
 # Logic to Handle Response Generation
 # Checks if the last message is from the user, implying we need to reply.
@@ -306,6 +365,7 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
             
             # Detect if it's a comparison query (simple heuristic based on our button prompts)
             is_comparison = "Compare" in user_input and "golden" in user_input.lower()
+            streamed_answer = None
             
             if is_comparison:
                 # Deterministic Check: Are the files identical?
@@ -315,7 +375,7 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                 if g_hash and c_hash and g_hash == c_hash:
                     # Short-circuit
                     response_data = {
-                        "result": "### ✅ Identical Configurations\n\nThe Golden and Candidate configuration files are **digitally identical** (SHA256 Match). No differences found.",
+                        "result": "### ✅ Identical Configurations\n\nThe Golden and Candidate configuration files are **digitally identical** (Content Hash Match). No differences found.",
                         "source_documents": [],
                         "model": "Deterministic Check",
                         "latency": 0.00
@@ -332,35 +392,84 @@ if st.session_state.messages and st.session_state.messages[-1]["role"] == "user"
                     # Retrieve the clean filenames from session state (if available) to ensure we compare the RIGHT files
                     g_meta = st.session_state.get("golden_filename_clean")
                     c_meta = st.session_state.get("candidate_filename_clean")
+                    g_path = st.session_state.get("golden_path")
+                    c_path = st.session_state.get("candidate_path")
                     
-                    response_data = st.session_state.chatbot.compare_configs(
-                        user_input, 
-                        golden_filename=g_meta, 
-                        candidate_filename=c_meta,
-                        mode=comparison_mode
-                    )
+                    # Small edits: an exact line diff is faster and more accurate than the LLM
+                    diff_lines = None
+                    if comparison_mode == "deep" and g_path and c_path:
+                        start_time = time.time()
+                        diff_lines = config_diff(g_path, g_hash, g_meta, c_path, c_hash, c_meta)
+                    
+                    if diff_lines is not None and len(diff_lines) < DIFF_SHORT_CIRCUIT_LINES:
+                        if diff_lines:
+                            diff_text = "\n".join(diff_lines)
+                            result = f"### 🔀 Configuration Diff\n\n```diff\n{diff_text}\n```"
+                        else:
+                            result = "### ✅ No Configuration Differences\n\nThe files only differ in comments, blank lines or banners."
+                        response_data = {
+                            "result": result,
+                            "source_documents": [],
+                            "model": "Deterministic Diff",
+                            "latency": round(time.time() - start_time, 2)
+                        }
+                    else:
+                        # Deep mode streams tokens into a placeholder as they arrive
+                        placeholder = st.empty()
+                        streamed_tokens = []
+                        last_render = {"at": 0.0}
+                        
+                        def show_token(token):
+                            # Throttled: re-sending the whole answer per token is quadratic
+                            streamed_tokens.append(token)
+                            now = time.monotonic()
+                            if now - last_render["at"] >= STREAM_RENDER_INTERVAL:
+                                last_render["at"] = now
+                                placeholder.markdown("".join(streamed_tokens))
+                        
+                        response_data = chatbot.compare_configs(
+                            user_input, 
+                            golden_filename=g_meta, 
+                            candidate_filename=c_meta,
+                            mode=comparison_mode,
+                            on_token=show_token
+                        )
+                        placeholder.markdown(response_data["result"])
+                        streamed_answer = response_data["result"]
             else:
-                response_data = st.session_state.chatbot.ask(user_input)
+                # A cached answer (with its own sources) skips retrieval entirely
+                response_data = chatbot.cached_answer(user_input)
+                if response_data is None:
+                    # Stream tokens as they arrive; sources are retrieved up front
+                    start_time = time.time()
+                    sources = chatbot.retrieve(user_input)
+                    streamed_answer = st.write_stream(
+                        chatbot.ask_stream(user_input, sources)
+                    )
+                    response_data = {
+                        "result": streamed_answer,
+                        "source_documents": sources,
+                        "model": chatbot.model_name,
+                        "latency": round(time.time() - start_time, 2)
+                    }
             
             answer = response_data["result"]
             sources = response_data["source_documents"]
             latency = response_data["latency"]
             
-            st.markdown(answer)
+            if streamed_answer is None:
+                st.markdown(answer)
             st.caption(f"⏱️ {latency}s | Model: {response_data['model']}")
             
+            citations_rendered = render_sources(sources) if sources else ""
             if sources:
                 with st.expander("📚 Sources"):
-                    for doc in sources:
-                        st.markdown(f"**{doc.metadata.get('source', 'Unknown')}** (Line {doc.metadata.get('line_start')}-{doc.metadata.get('line_end')})")
-                        st.code(doc.page_content, language="text")
+                    st.markdown(citations_rendered)
             
             # Save history
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": answer,
-                "citations": sources
+                "citations": sources,
+                "citations_rendered": citations_rendered
             })
-            
-            # Rerun to update state properly
-            st.rerun()
@@ -1,14 +1,25 @@
+import os
+import re
 import time
-from typing import List, Dict, Any, Tuple
-from langchain_community.chat_models import ChatOllama
-from langchain_core.prompts import PromptTemplate
-from langchain_classic.chains import RetrievalQA
-from langchain_classic.retrievers import ContextualCompressionRetriever
-from langchain_classic.retrievers.document_compressors import LLMChainExtractor
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from functools import cached_property
+from typing import TYPE_CHECKING, List, Dict, Any, Tuple, Iterator, Optional, Callable
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
+from langchain_core.messages import SystemMessage, HumanMessage
 
 from ingestion import IngestionEngine
-from utils import logger
+from utils import logger, compute_content_hash, normalize_block_text
+
+# The Ollama client and RetrievalQA pull in heavy import chains; they are
+# imported where first used so ingestion-only callers never pay for them.
+if TYPE_CHECKING:
+    from langchain_community.chat_models import ChatOllama
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -16,15 +27,26 @@ from utils import logger
 
 DEFAULT_MODEL = "llama3.2:3b"
 
-PROMPT_TEMPLATE = """
-You are a Senior Network Engineer assistant. You answer questions STRICTLY based on the provided network configuration chunks.
-You are deterministic and precise.
+# Deep-compare retrieval drops chunks below this cosine to the query
+COMPARE_SCORE_THRESHOLD = 0.3
 
-CONTEXT:
-{context}
+# Focus keywords for compare_configs, found in one pass over the query.
+# Substring semantics on purpose: "VLANs", "Interfaces", "Routes" must match.
+_FOCUS_RE = re.compile(r"vlan|interface|route|ospf|acl|security|qos|hostname", re.IGNORECASE)
 
-USER QUERY:
-{question}
+# Identifiers a semantic cache hit must repeat verbatim: any token with a digit
+# (VLAN/ACL numbers, addresses, interface names like Gi0/1), with '/', '_', '-'
+# or ':' (route-map and VRF names), or with an uppercase letter after its first
+# character (GigabitEthernet, VLANs). A capital at the start alone ("What",
+# "Which") is just a sentence start, so those words are left to the embedding.
+_TOKEN_RE = re.compile(r"[\w./:-]*\w")
+_IDENTIFIER_RE = re.compile(r"[\d/_:-]|(?<=.)[A-Z]")
+
+# Static instructions first, dynamic context/question last: the system prompt is
+# byte-identical across queries so Ollama can reuse its KV cache for it.
+SYSTEM_PROMPT = """
+You are a Senior Network Engineer assistant. You answer questions STRICTLY based on the provided network configuration chunks.
+You are deterministic and precise.
 
 INSTRUCTIONS:
 1. Answer the query using ONLY the information in the CONTEXT.
@@ -32,10 +54,148 @@ INSTRUCTIONS:
 3. Cite the exact configuration lines, section names, or file names for every fact.
 4. Do not speculate or use outside knowledge.
 5. Format the output as clean Markdown.
+"""
+
+PROMPT_TEMPLATE = """
+CONTEXT:
+{context}
+
+USER QUERY:
+{question}
 
 ANSWER:
 """
 
+# Deep-compare instructions, sent as a fixed system message ahead of the
+# per-compare results so it is reused as a prefix too.
+DEEP_COMPARE_INSTRUCTIONS = """
+You are a Senior Network Engineer performing a detailed configuration audit.
+
+INSTRUCTIONS:
+Provide a comprehensive analysis including:
+
+1. **Executive Summary**: Brief overview of the comparison results
+2. **Critical Differences**: Highlight any differences that could impact:
+   - Network functionality
+   - Security posture
+   - Performance
+   - Compliance
+3. **Missing Configurations**: Analyze what's missing in the candidate and why it matters
+4. **Extra Configurations**: Evaluate additional configs in candidate (good or bad?)
+5. **Security Implications**: Any security concerns from the differences?
+6. **Best Practice Recommendations**: Suggestions for improvement
+7. **Risk Assessment**: Rate the risk of deploying the candidate config (Low/Medium/High)
+
+Format your response in clear, well-structured Markdown with headers and bullet points.
+"""
+
+DEEP_COMPARE_REQUEST = "CONFIGURATION COMPARISON RESULTS:\n{context}\n\nUSER REQUEST:\n{query}"
+
+def _mmr_select(query_scores: np.ndarray, doc_embs: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    Maximal marginal relevance over unit float32 rows. The doc-doc cosine matrix
+    is one matmul; each pick then only updates a running max-similarity vector.
+    """
+    n = len(query_scores)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    pairwise = doc_embs @ doc_embs.T
+    redundancy = np.full(n, -np.inf, dtype=np.float32)
+    chosen = np.zeros(n, dtype=bool)
+    picked = []
+    for _ in range(k):
+        if picked:
+            mmr = lambda_mult * query_scores - (1 - lambda_mult) * redundancy
+        else:
+            mmr = query_scores.copy()
+        mmr[chosen] = -np.inf
+        best = int(mmr.argmax())
+        picked.append(best)
+        chosen[best] = True
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+# -----------------------------------------------------------------------------
+# Semantic Response Cache
+# -----------------------------------------------------------------------------
+
+class SemanticCache:
+    """
+    In-memory cache of answered queries keyed by query embedding.
+    A lookup returns a previous answer when cosine similarity >= threshold and
+    the query names exactly the same identifiers (embeddings can't tell
+    "vlan 10" from "vlan 11"). Entries are tied to a version (corpus + model)
+    and dropped when it changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_size: int = 512):
+        self.threshold = threshold
+        self.max_size = max_size
+        self._matrix: Optional[np.ndarray] = None  # (N, d) unit vectors
+        self._entries: List[Dict[str, Any]] = []
+        self._identifiers: List[Tuple[str, ...]] = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def identifiers(query: str) -> Tuple[str, ...]:
+        """Numeric, interface and named-object tokens of a query, in order (case-sensitive)."""
+        return tuple(token for token in _TOKEN_RE.findall(query) if _IDENTIFIER_RE.search(token))
+
+    def _sync_version(self, version):
+        if version != self._version:
+            self._matrix = None
+            self._entries = []
+            self._identifiers = []
+            self._version = version
+
+    def lookup(self, query: str, query_vector: List[float], version) -> Optional[Dict[str, Any]]:
+        """Returns the cached entry for the closest matching query, or None on miss."""
+        identifiers = self.identifiers(query)
+        with self._lock:
+            self._sync_version(version)
+            if self._matrix is None:
+                return None
+            # Rows are unit vectors, so the dot product is the cosine similarity
+            sims = self._matrix @ self._normalize(query_vector)
+            hits = np.flatnonzero(sims >= self.threshold)
+            # Closest first; a near-identical query naming other identifiers is not a hit
+            for row in hits[np.argsort(-sims[hits])]:
+                if self._identifiers[row] == identifiers:
+                    return self._entries[row]
+            return None
+
+    def add(self, query: str, query_vector: List[float], entry: Dict[str, Any], version):
+        """Stores an answer, evicting the oldest entry (FIFO) when full."""
+        with self._lock:
+            self._sync_version(version)
+            row = self._normalize(query_vector)[np.newaxis, :]
+            if self._matrix is None:
+                self._matrix = row
+            else:
+                self._matrix = np.vstack([self._matrix, row])
+            self._entries.append(entry)
+            self._identifiers.append(self.identifiers(query))
+
+            if len(self._entries) > self.max_size:
+                self._matrix = self._matrix[1:]
+                self._entries.pop(0)
+                self._identifiers.pop(0)
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._entries = []
+            self._identifiers = []
+
 # -----------------------------------------------------------------------------
 # Chat Module
 # -----------------------------------------------------------------------------
@@ -44,48 +204,177 @@ class RAGChatbot:
     """
     Main RAG Class governing the interaction between UI, VectorDB, and LLM.
     """
-    def __init__(self, model_name: str = DEFAULT_MODEL):
+    def __init__(self, model_name: str = DEFAULT_MODEL, ingestion: IngestionEngine = None):
         self.model_name = model_name
-        self.ingestion = IngestionEngine()
-        self.llm = ChatOllama(
+        # Share an existing engine (embedding model + Chroma client) when given
+        self.ingestion = ingestion or IngestionEngine()
+        # One client per model; switching back to a model reuses its warm client
+        self._llms: Dict[str, "ChatOllama"] = {}
+        self.llm = self._get_llm(model_name)
+        self._warm_up()
+        # Retriever and prompt are independent of the LLM; built once
+        self.retriever = self.ingestion.get_retriever()
+        self._prompt = ChatPromptTemplate.from_messages([
+            ("system", SYSTEM_PROMPT),
+            ("human", PROMPT_TEMPLATE)
+        ])
+        # Exact-match LRU in front of the embedding-similarity cache
+        self._response_cache: OrderedDict = OrderedDict()
+        self._response_cache_size = 256
+        self._response_lock = threading.Lock()
+        self.semantic_cache = SemanticCache()
+
+    def _create_llm(self, model_name: str) -> "ChatOllama":
+        """Builds the Ollama client for a model."""
+        from langchain_community.chat_models import ChatOllama
+
+        return ChatOllama(
             model=model_name,
             temperature=0.1, # Low temp for deterministic outputs
-            keep_alive="5m"
+            keep_alive="30m", # Long-lived sessions should not re-pay model load
+            num_ctx=8192, # Room for the cached instruction prefix + retrieved context
+            num_predict=1024, # Bound runaway generations
+            num_thread=os.cpu_count(),
+            timeout=120
         )
-        self.retriever = self.ingestion.get_retriever()
-        self.chain = self._build_chain()
 
-    def _build_chain(self):
-        """Constructs the LangChain QA pipeline."""
-        prompt = PromptTemplate(
-            template=PROMPT_TEMPLATE,
-            input_variables=["context", "question"]
-        )
+    def _get_llm(self, model_name: str) -> "ChatOllama":
+        if model_name not in self._llms:
+            self._llms[model_name] = self._create_llm(model_name)
+        return self._llms[model_name]
+
+    def _warm_up(self):
+        """
+        Fires a 1-token generation in the background so Ollama loads the model
+        weights while the user is still typing. Never blocks the caller.
+        """
+        llm, model_name = self.llm, self.model_name
+
+        def _ping():
+            try:
+                llm.invoke("ok", num_predict=1)
+            except Exception as e:
+                logger.warning(f"Warm-up failed for {model_name}: {e}")
+
+        self._warm_thread = threading.Thread(target=_ping, daemon=True)
+        self._warm_thread.start()
 
-        chain = RetrievalQA.from_chain_type(
+    @cached_property
+    def chain(self):
+        """RetrievalQA over the current LLM, prebuilt retriever and prompt; built on first ask."""
+        from langchain_classic.chains import RetrievalQA
+
+        return RetrievalQA.from_chain_type(
             llm=self.llm,
             chain_type="stuff",
             retriever=self.retriever,
-            chain_type_kwargs={"prompt": prompt},
+            chain_type_kwargs={"prompt": self._prompt},
             return_source_documents=True
         )
-        return chain
+
+    @cached_property
+    def stream_chain(self):
+        """Token streaming path (same prompt, retrieval done by the caller)."""
+        return self._prompt | self.llm | StrOutputParser()
 
     def update_model(self, model_name: str):
         """Switches the backend LLM."""
         logger.info(f"Switching model to {model_name}")
         self.model_name = model_name
-        self.llm = ChatOllama(
-            model=model_name,
-            temperature=0.1,
-            keep_alive="5m"
-        )
-        # Rebuild chain with new LLM
-        self.chain = self._build_chain()
+        self.llm = self._get_llm(model_name)
+        self._warm_up()
+        # Only the LLM changes: swap it into the built QA chain instead of rebuilding it
+        if "chain" in self.__dict__:
+            self.chain.combine_documents_chain.llm_chain.llm = self.llm
+        self.__dict__.pop("stream_chain", None) # Plain LCEL pipe, cheap to recompose
+
+    def attach_ingestion(self, ingestion: IngestionEngine):
+        """
+        Points the bot at another engine (e.g. another Chroma collection). LLM
+        clients are kept; retriever, QA chain and answer caches are reset.
+        """
+        self.ingestion = ingestion
+        self.retriever = ingestion.get_retriever()
+        self.__dict__.pop("chain", None)
+        # Versions restart per engine, so cached answers can't be told apart
+        with self._response_lock:
+            self._response_cache.clear()
+        self.semantic_cache.clear()
+
+    def _embed_query(self, query: str) -> List[float]:
+        """Query embedding via the shared LRU (keyed by embedder + normalized text)."""
+        return self.ingestion.embeddings.embed_query(query)
+
+    def _cache_version(self) -> Tuple[int, str]:
+        """Cached answers are only valid for the same corpus and model."""
+        return (self.ingestion.corpus_version, self.model_name)
 
-    def process_file(self, file_path: str, extra_metadata: Dict[str, Any] = None) -> bool:
+    def _response_key(self, query: str) -> str:
+        corpus_version, model_name = self._cache_version()
+        # Whitespace-normalized only: ACL, route-map and VRF names are case-sensitive
+        normalized = " ".join(query.split())
+        return hashlib.sha256(f"{model_name}|{corpus_version}|{normalized}".encode("utf-8")).hexdigest()
+
+    def _lookup_response(self, query: str) -> Optional[Dict[str, Any]]:
+        """Checks the exact-match cache, then the semantic cache. Returns the entry or None."""
+        key = self._response_key(query)
+        with self._response_lock:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                self._response_cache.move_to_end(key)
+                return cached
+
+        return self.semantic_cache.lookup(query, self._embed_query(query), self._cache_version())
+
+    def _store_response(self, key: str, query: str, entry: Dict[str, Any]):
+        """`key` is taken before generation, so an answer never outlives the corpus it came from."""
+        with self._response_lock:
+            self._response_cache[key] = entry
+            if len(self._response_cache) > self._response_cache_size:
+                self._response_cache.popitem(last=False)
+        # The lookup already embedded this query, so the embedding LRU serves it
+        self.semantic_cache.add(query, self._embed_query(query), entry, self._cache_version())
+
+    def cached_answer(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        The response-cache entry for a query as an `ask`-shaped dict (stored answer,
+        its own source documents, labelled as cached), or None on a miss.
+        Meant to be checked before any retrieval.
+        """
+        start_time = time.time()
+        try:
+            cached = self._lookup_response(query)
+        except Exception as e:
+            logger.error(f"Response cache lookup failed: {e}")
+            return None
+        if cached is None:
+            return None
+        logger.info(f"Response cache hit: {query}")
+        return {
+            "result": cached["result"],
+            "source_documents": cached["source_documents"],
+            "model": f"{cached['model']} (cached)",
+            "latency": round(time.time() - start_time, 2)
+        }
+
+    def process_file(self, file_path: str, extra_metadata: Dict[str, Any] = None, filename: str = None) -> bool:
         """Wrapper to pass file ingestion to the engine."""
-        return self.ingestion.process_file(file_path, extra_metadata)
+        return self.ingestion.process_file(file_path, extra_metadata, filename)
+
+    def process_content(self, content: str, filename: str, extra_metadata: Dict[str, Any] = None) -> bool:
+        """Wrapper to pass in-memory config content to the engine."""
+        return self.ingestion.process_content(content, filename, extra_metadata)
+
+    def process_contents(self, contents: List[tuple]) -> List[bool]:
+        """Ingests several (content, filename, extra_metadata) specs with one batched embedding pass."""
+        return self.ingestion.process_contents(contents)
+
+    def process_files(self, files: List[tuple]) -> List[bool]:
+        """
+        Ingests several (file_path, extra_metadata[, filename]) specs with one
+        batched embedding pass. Results are returned in input order.
+        """
+        return self.ingestion.process_files(files)
 
     def ask(self, query: str) -> Dict[str, Any]:
         """
@@ -100,11 +389,23 @@ class RAGChatbot:
         start_time = time.time()
         
         try:
+            # Response caches: skip retrieval + generation for repeated / near-identical queries
+            cached = self.cached_answer(query)
+            if cached:
+                return cached
+
+            cache_key = self._response_key(query)
             logger.info(f"Querying: {query}")
             response = self.chain.invoke({"query": query})
             
             end_time = time.time()
             latency = end_time - start_time
+
+            self._store_response(cache_key, query, {
+                "result": response["result"],
+                "source_documents": response["source_documents"],
+                "model": self.model_name
+            })
             
             return {
                 "result": response["result"],
@@ -121,7 +422,205 @@ class RAGChatbot:
                 "latency": 0.0
             }
 
-    def compare_configs(self, query: str, golden_filename: str = None, candidate_filename: str = None, mode: str = "quick") -> Dict[str, Any]:
+    def retrieve(self, query: str) -> List[Document]:
+        """Fetches the source chunks for a query (used before streaming)."""
+        try:
+            return self.retriever.invoke(query)
+        except Exception as e:
+            logger.error(f"Retrieval Error: {e}")
+            return []
+
+    def ask_stream(self, query: str, source_documents: List[Document] = None) -> Iterator[str]:
+        """
+        Streaming variant of `ask`. Yields the LLM response token by token.
+        Without `source_documents`, the response cache is checked before anything
+        is retrieved. Callers that already got a `cached_answer` miss pass the
+        documents from `retrieve` (citations known up front); the cache is not checked twice.
+        """
+        try:
+            if source_documents is None:
+                cached = self.cached_answer(query)
+                if cached:
+                    yield cached["result"]
+                    return
+                source_documents = self.retrieve(query)
+            cache_key = self._response_key(query)
+
+            # Mirror the "stuff" chain formatting used by RetrievalQA
+            context = "\n\n".join(doc.page_content for doc in source_documents)
+
+            logger.info(f"Streaming query: {query}")
+            tokens = []
+            for token in self.stream_chain.stream({"context": context, "question": query}):
+                tokens.append(token)
+                yield token
+
+            self._store_response(cache_key, query, {
+                "result": "".join(tokens),
+                "source_documents": source_documents,
+                "model": self.model_name
+            })
+        except Exception as e:
+            logger.error(f"Chat Stream Error: {e}")
+            yield f"Error generating response: {str(e)}"
+
+    @staticmethod
+    def _role_filter(role: str, filename: str = None, section_types: List[str] = None) -> Dict[str, Any]:
+        """Chroma `where` clause selecting one config role (and optionally one file / section types)."""
+        clauses = [{"config_role": role}]
+        if filename:
+            clauses.append({"source": filename})
+        if section_types:
+            clauses.append({"section_type": {"$in": section_types}})
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
+
+    def _scan_both(self, filter_golden: Dict[str, Any], filter_candidate: Dict[str, Any]):
+        """
+        Enumerates every chunk matching each filter with a metadata-only scan.
+        No query embedding and no ANN search; used where ranking is not needed.
+        """
+        store = self.ingestion.vector_store
+
+        def scan(where):
+            data = store.get(where=where, include=["metadatas", "documents"])
+            return [
+                Document(page_content=text, metadata=meta or {})
+                for text, meta in zip(data["documents"], data["metadatas"])
+            ]
+
+        return scan(filter_golden), scan(filter_candidate)
+
+    def _mmr_search(self, query_vector: np.ndarray, where: Dict[str, Any], k: int, fetch_k: int) -> List[Document]:
+        """
+        Pulls `fetch_k` nearest chunks (with their stored embeddings), drops those
+        under COMPARE_SCORE_THRESHOLD cosine, then picks `k` diverse ones by MMR.
+        """
+        results = self.ingestion.vector_store._collection.query(
+            query_embeddings=[query_vector.tolist()],
+            n_results=fetch_k,
+            where=where,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        texts = results["documents"][0]
+        if not texts:
+            return []
+
+        doc_embs = np.asarray(results["embeddings"][0], dtype=np.float32)
+        doc_embs /= np.linalg.norm(doc_embs, axis=1, keepdims=True) + 1e-12
+        scores = doc_embs @ query_vector
+
+        # Nothing over the threshold means a vague query, not an empty config: keep all
+        keep = np.flatnonzero(scores >= COMPARE_SCORE_THRESHOLD)
+        if not keep.size:
+            keep = np.arange(len(texts))
+
+        metadatas = results["metadatas"][0]
+        picked = _mmr_select(scores[keep], doc_embs[keep], k)
+        return [
+            Document(page_content=texts[keep[i]], metadata=metadatas[keep[i]] or {})
+            for i in picked
+        ]
+
+    def _retrieve_both(self, query: str, filter_golden: Dict[str, Any], filter_candidate: Dict[str, Any], k: int = 20):
+        """
+        Runs the golden and candidate searches concurrently; they are independent.
+        The query is embedded once and both searches go by vector (MMR over 4*k).
+        """
+        query_vector = np.asarray(self._embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) + 1e-12
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            golden = pool.submit(self._mmr_search, query_vector, filter_golden, k, 4 * k)
+            candidate = pool.submit(self._mmr_search, query_vector, filter_candidate, k, 4 * k)
+            return golden.result(), candidate.result()
+
+    def _group_by_parent(self, docs: List[Document], role: str, filename: str = None,
+                         parents: set = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Maps parent_line -> block info for the retrieved docs. Uses the block index
+        built at ingest time when the file is known; otherwise groups from metadata.
+        `parents` widens the index lookup beyond this role's own hits.
+        """
+        index = self.ingestion.get_block_index(filename, role) if filename else None
+        if index is not None:
+            if parents is None:
+                parents = {doc.metadata.get('parent_line', 'unknown') for doc in docs}
+            return {parent: index[parent] for parent in parents if parent in index}
+
+        by_parent = {}
+        for doc in docs:
+            parent = doc.metadata.get('parent_line', 'unknown')
+            by_parent[parent] = {
+                'content': doc.page_content.strip(),
+                'content_hash': doc.metadata.get('content_hash'),
+                'section_type': doc.metadata.get('section_type', 'unknown')
+            }
+        return by_parent
+
+    @staticmethod
+    def _index_documents(index: Dict[str, Dict[str, Any]], role: str, filename: str,
+                         parents: List[str]) -> List[Document]:
+        """Citation documents for `parents`, rebuilt from a block index (same metadata shape as the store)."""
+        return [
+            Document(
+                page_content=info['content'],
+                metadata={
+                    "source": filename,
+                    "config_role": role,
+                    "parent_line": parent,
+                    "section_type": info['section_type'],
+                    "line_start": info['line_start'],
+                    "line_end": info['line_end']
+                }
+            )
+            for parent in parents if (info := index.get(parent)) is not None
+        ]
+
+    @staticmethod
+    def _same_content(golden_info: Dict[str, Any], candidate_info: Dict[str, Any]) -> bool:
+        """
+        Compares the precomputed fingerprints; the normalized text is only walked
+        when they agree, to rule out a collision.
+        """
+        golden_hash = golden_info.get('content_hash') or compute_content_hash(golden_info['content'])
+        candidate_hash = candidate_info.get('content_hash') or compute_content_hash(candidate_info['content'])
+        if golden_hash != candidate_hash:
+            return False
+        return normalize_block_text(golden_info['content']) == normalize_block_text(candidate_info['content'])
+
+    def _pair_similarity(self, pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> np.ndarray:
+        """
+        Cosine similarity for each (golden_info, candidate_info) block pair, using the
+        vectors already stored in Chroma for those blocks (looked up by content_hash).
+        Only a block with no stored vector is embedded.
+        """
+        def block_hash(info):
+            return info.get('content_hash') or compute_content_hash(info['content'])
+
+        contents = {block_hash(info): info['content'] for pair in pairs for info in pair}
+        stored = self.ingestion.vector_store._collection.get(
+            where={"content_hash": {"$in": list(contents)}},
+            include=["metadatas", "embeddings"]
+        )
+        vectors = {}
+        for meta, vector in zip(stored["metadatas"], stored["embeddings"]):
+            vectors.setdefault(meta["content_hash"], vector)
+
+        missing = [content_hash for content_hash in contents if content_hash not in vectors]
+        if missing:
+            vectors.update(zip(missing, self.ingestion.embeddings.embed_documents([contents[h] for h in missing])))
+
+        def unit_rows(infos):
+            rows = np.asarray([vectors[block_hash(info)] for info in infos], dtype=np.float32)
+            return rows / (np.linalg.norm(rows, axis=1, keepdims=True) + 1e-12)
+
+        golden = unit_rows([g for g, _ in pairs])
+        candidate = unit_rows([c for _, c in pairs])
+        return np.einsum("ij,ij->i", golden, candidate)
+
+    def compare_configs(self, query: str, golden_filename: str = None, candidate_filename: str = None, mode: str = "quick",
+                        on_token: Callable[[str], None] = None) -> Dict[str, Any]:
         """
         Specialized method for comparing two configurations.
         
@@ -130,6 +629,7 @@ class RAGChatbot:
             golden_filename: Name of the golden config file
             candidate_filename: Name of the candidate config file
             mode: "quick" for deterministic table, "deep" for LLM analysis
+            on_token: Optional callback receiving each streamed token in deep mode
         
         Returns:
             Dict with result, source_documents, model, and latency
@@ -138,78 +638,84 @@ class RAGChatbot:
         try:
             logger.info(f"Comparing: {query} (Golden: {golden_filename}, Candidate: {candidate_filename}, Mode: {mode})")
             
-            # 1. Construct Filters
-            if golden_filename:
-                filter_golden = {
-                    "$and": [
-                        {"config_role": "golden"},
-                        {"source": golden_filename}
-                    ]
-                }
-            else:
-                filter_golden = {"config_role": "golden"}
-
-            if candidate_filename:
-                filter_candidate = {
-                    "$and": [
-                        {"config_role": "candidate"},
-                        {"source": candidate_filename}
-                    ]
-                }
-            else:
-                filter_candidate = {"config_role": "candidate"}
-                
-            # 2. Retrieve Chunks
-            docs_golden = self.ingestion.vector_store.similarity_search(
-                query, 
-                k=50, 
-                filter=filter_golden
-            )
+            # 0. Identical files need no retrieval at all
+            golden_hash = candidate_hash = None
+            if golden_filename and candidate_filename:
+                golden_hash = self.ingestion.get_file_hash(golden_filename, "golden")
+                candidate_hash = self.ingestion.get_file_hash(candidate_filename, "candidate")
+                if golden_hash and golden_hash == candidate_hash:
+                    return {
+                        "result": "### ✅ Identical Configurations\n\nThe Golden and Candidate configuration files are **digitally identical** (Content Hash Match). No differences found.",
+                        "source_documents": [],
+                        "model": "Deterministic Check",
+                        "latency": round(time.time() - start_time, 2)
+                    }
             
-            docs_candidate = self.ingestion.vector_store.similarity_search(
-                query, 
-                k=50, 
-                filter=filter_candidate
-            )
+            # Parse query to understand focus areas
+            focus = {m.group(0).lower() for m in _FOCUS_RE.finditer(query)}
+            focus_vlans = 'vlan' in focus
+            focus_interfaces = 'interface' in focus
+            focus_routes = 'route' in focus or 'ospf' in focus
+            focus_acls = 'acl' in focus or 'security' in focus
+            focus_qos = 'qos' in focus
+            focus_hostname = 'hostname' in focus
             
-            # 3. Group by parent_line for comparison
-            golden_by_parent = {}
-            for doc in docs_golden:
-                parent = doc.metadata.get('parent_line', 'unknown')
-                section_type = doc.metadata.get('section_type', 'unknown')
-                golden_by_parent[parent] = {
-                    'content': doc.page_content.strip(),
-                    'section_type': section_type
-                }
+            # 1. Construct Filters (applied inside Chroma, not post-filtered in Python).
+            # ACL/QoS focus is matched on the parent line, so it can't be pushed down.
+            section_types = None
+            if not (focus_acls or focus_qos):
+                section_types = [section for section, focused in (
+                    ("vlan", focus_vlans),
+                    ("interface", focus_interfaces),
+                    ("router", focus_routes)
+                ) if focused] or None
             
-            candidate_by_parent = {}
-            for doc in docs_candidate:
-                parent = doc.metadata.get('parent_line', 'unknown')
-                section_type = doc.metadata.get('section_type', 'unknown')
-                candidate_by_parent[parent] = {
-                    'content': doc.page_content.strip(),
-                    'section_type': section_type
-                }
+            # 2. Quick mode on two known files is a pure dict diff of the ingest-time
+            # block indexes: full recall and no Chroma call at all.
+            golden_by_parent = candidate_by_parent = None
+            if mode == "quick" and golden_hash and candidate_hash:
+                golden_by_parent = self.ingestion.get_block_index(golden_filename, "golden", golden_hash)
+                candidate_by_parent = self.ingestion.get_block_index(candidate_filename, "candidate", candidate_hash)
             
-            all_parents = set(golden_by_parent.keys()) | set(candidate_by_parent.keys())
+            from_index = golden_by_parent is not None and candidate_by_parent is not None
+            if not from_index:
+                # Otherwise retrieve chunks: quick mode enumerates by metadata,
+                # only deep mode needs a similarity search.
+                if mode == "quick":
+                    docs_golden, docs_candidate = self._scan_both(
+                        self._role_filter("golden", golden_filename, section_types),
+                        self._role_filter("candidate", candidate_filename, section_types)
+                    )
+                else:
+                    # 10 chunks per role, plus 10 per focus area named in the query
+                    k = 10 + 10 * sum([focus_vlans, focus_interfaces, focus_routes, focus_acls, focus_qos])
+                    docs_golden, docs_candidate = self._retrieve_both(
+                        query,
+                        self._role_filter("golden", golden_filename),
+                        self._role_filter("candidate", candidate_filename),
+                        k=k
+                    )
+                
+                # 3. Group by parent_line for comparison. A section retrieved for one role
+                # is looked up in the other role's block index too, so a smaller k can't
+                # turn a section that ranked lower on one side into a false MISSING/EXTRA.
+                parents = {doc.metadata.get('parent_line', 'unknown') for doc in docs_golden + docs_candidate}
+                golden_by_parent = self._group_by_parent(docs_golden, "golden", golden_filename, parents)
+                candidate_by_parent = self._group_by_parent(docs_candidate, "candidate", candidate_filename, parents)
             
-            # Parse query to understand focus areas
-            focus_vlans = 'vlan' in query.lower()
-            focus_interfaces = 'interface' in query.lower()
-            focus_routes = 'route' in query.lower() or 'ospf' in query.lower()
-            focus_acls = 'acl' in query.lower() or 'security' in query.lower()
-            focus_qos = 'qos' in query.lower()
+            all_parents = set(golden_by_parent.keys()) | set(candidate_by_parent.keys())
             
             # MODE: QUICK - Deterministic Comparison
             if mode == "quick":
                 result_rows = []
+                shown_parents = [] # Only sections that reach the table are cited
                 
                 for parent in sorted(all_parents):
                     golden_info = golden_by_parent.get(parent)
                     candidate_info = candidate_by_parent.get(parent)
                     
                     # Skip hostname unless explicitly requested
-                    if 'hostname' in parent.lower() and 'hostname' not in query.lower():
+                    if not focus_hostname and 'hostname' in parent.lower():
                         continue
                     
                     # Filter by section type based on query
@@ -238,7 +744,7 @@ class RAGChatbot:
                     
                     # Determine status
                     if golden_info and candidate_info:
-                        if golden_info['content'] == candidate_info['content']:
+                        if self._same_content(golden_info, candidate_info):
                             status = "✅ MATCH"
                         else:
                             status = f"⚠️ DIFF"
@@ -252,6 +758,7 @@ class RAGChatbot:
                     # Format the parent line for display
                     display_parent = parent.replace('\n', ' / ')
                     result_rows.append(f"| {display_parent} | {status} |")
+                    shown_parents.append(parent)
                 
                 # Build result table
                 if result_rows:
@@ -265,12 +772,21 @@ class RAGChatbot:
                     result_text = "No relevant features found to compare based on the query."
                 
                 model_label = f"{self.model_name} (deterministic)"
+                
+                # Citations for the table rows only
+                if from_index:
+                    docs = (self._index_documents(golden_by_parent, "golden", golden_filename, shown_parents)
+                            + self._index_documents(candidate_by_parent, "candidate", candidate_filename, shown_parents))
+                else:
+                    shown = set(shown_parents)
+                    docs = [doc for doc in docs_golden + docs_candidate
+                            if doc.metadata.get('parent_line', 'unknown') in shown]
             
             # MODE: DEEP - LLM Analysis
             else:
                 # Build comprehensive context for LLM
                 differences = []
-                matches = []
+                match_count = 0 # Only the count reaches the prompt
                 missing = []
                 extra = []
                 
@@ -279,28 +795,39 @@ class RAGChatbot:
                     candidate_info = candidate_by_parent.get(parent)
                     
                     if golden_info and candidate_info:
-                        if golden_info['content'] == candidate_info['content']:
-                            matches.append(f"**{parent}**: Identical")
+                        if self._same_content(golden_info, candidate_info):
+                            match_count += 1
                         else:
                             differences.append({
                                 'feature': parent,
                                 'golden': golden_info['content'],
-                                'candidate': candidate_info['content']
+                                'candidate': candidate_info['content'],
+                                'blocks': (golden_info, candidate_info)
                             })
                     elif golden_info and not candidate_info:
                         missing.append(f"**{parent}**:\n```\n{golden_info['content']}\n```")
                     elif not golden_info and candidate_info:
                         extra.append(f"**{parent}**:\n```\n{candidate_info['content']}\n```")
                 
+                # Most-divergent blocks first so the LLM spends its budget on real changes
+                if differences:
+                    similarities = self._pair_similarity([d['blocks'] for d in differences])
+                    for diff, similarity in zip(differences, similarities):
+                        diff['similarity'] = float(similarity)
+                    differences.sort(key=lambda d: d['similarity'])
+                
                 # Build detailed prompt for LLM
                 context_parts = []
                 
                 if differences:
                     context_parts.append("### DIFFERENCES DETECTED:\n")
-                    for diff in differences:
-                        context_parts.append(f"\n**Feature: {diff['feature']}**")
-                        context_parts.append(f"\nGolden Config:\n```\n{diff['golden']}\n```")
-                        context_parts.append(f"\nCandidate Config:\n```\n{diff['candidate']}\n```")
+                    # One pre-formatted string per difference
+                    context_parts.extend(
+                        f"\n**Feature: {diff['feature']}** (semantic similarity {diff['similarity']:.2f})\n"
+                        f"\nGolden Config:\n```\n{diff['golden']}\n```\n"
+                        f"\nCandidate Config:\n```\n{diff['candidate']}\n```"
+                        for diff in differences
+                    )
                 
                 if missing:
                     context_parts.append("\n### MISSING IN CANDIDATE:\n")
@@ -310,49 +837,32 @@ class RAGChatbot:
                     context_parts.append("\n### EXTRA IN CANDIDATE:\n")
                     context_parts.extend(extra)
                 
-                if matches:
-                    context_parts.append(f"\n### MATCHING FEATURES: {len(matches)} features are identical")
+                if match_count:
+                    context_parts.append(f"\n### MATCHING FEATURES: {match_count} features are identical")
                 
-                context_text = "\n".join(context_parts)
+                context_text = "\n".join(context_parts) # Sized once, single copy
                 
-                prompt = f"""
-You are a Senior Network Engineer performing a detailed configuration audit.
-
-CONFIGURATION COMPARISON RESULTS:
-{context_text}
-
-USER REQUEST:
-{query}
-
-INSTRUCTIONS:
-Provide a comprehensive analysis including:
-
-1. **Executive Summary**: Brief overview of the comparison results
-2. **Critical Differences**: Highlight any differences that could impact:
-   - Network functionality
-   - Security posture
-   - Performance
-   - Compliance
-3. **Missing Configurations**: Analyze what's missing in the candidate and why it matters
-4. **Extra Configurations**: Evaluate additional configs in candidate (good or bad?)
-5. **Security Implications**: Any security concerns from the differences?
-6. **Best Practice Recommendations**: Suggestions for improvement
-7. **Risk Assessment**: Rate the risk of deploying the candidate config (Low/Medium/High)
-
-Format your response in clear, well-structured Markdown with headers and bullet points.
-"""
+                # Static instructions go as the system message, the per-compare results last
+                messages = [
+                    SystemMessage(content=DEEP_COMPARE_INSTRUCTIONS),
+                    HumanMessage(content=DEEP_COMPARE_REQUEST.format_map({"context": context_text, "query": query}))
+                ]
                 
-                # Invoke LLM for deep analysis
-                response_msg = self.llm.invoke(prompt)
-                result_text = response_msg.content
+                # Stream the deep analysis; tokens are also collected for the return dict
+                tokens = []
+                for chunk in self.llm.stream(messages):
+                    tokens.append(chunk.content)
+                    if on_token:
+                        on_token(chunk.content)
+                result_text = "".join(tokens)
                 model_label = self.model_name
+                
+                # Combine docs for citation
+                docs = docs_golden + docs_candidate
             
             end_time = time.time()
             latency = end_time - start_time
             
-            # Combine docs for citation
-            docs = docs_golden + docs_candidate
-            
             return {
                 "result": result_text,
                 "source_documents": docs,
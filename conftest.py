@@ -0,0 +1,43 @@
+import uuid
+import pytest
+from chat_logic import RAGChatbot
+from ingestion import IngestionEngine
+
+MODEL_NAME = "llama3.2:3b"
+
+@pytest.fixture(scope="session")
+def chroma_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("chroma_db"))
+
+@pytest.fixture(scope="session")
+def bot(chroma_dir):
+    """
+    One chatbot for the whole session: the embedding model is loaded and the
+    Ollama model warmed once, instead of once per scenario.
+    """
+    bot = RAGChatbot(model_name=MODEL_NAME, ingestion=IngestionEngine(persist_directory=chroma_dir))
+    bot._warm_thread.join() # Wait for the 1-token warm-up completion
+    return bot
+
+@pytest.fixture
+def scenario_bot(bot, chroma_dir):
+    """
+    The session bot attached to a fresh, uniquely named collection.
+    Isolation comes from the collection name; the collection is dropped afterwards.
+    """
+    collection_name = f"scn_{uuid.uuid4().hex}"
+    engine = IngestionEngine(persist_directory=chroma_dir, collection_name=collection_name)
+    bot.attach_ingestion(engine)
+    yield bot
+    engine.vector_store._client.delete_collection(collection_name)
+
+@pytest.fixture
+def ingest_configs(scenario_bot):
+    """Ingests golden.cfg / candidate.cfg content straight from memory into the scenario collection."""
+    def ingest(golden_content: str, candidate_content: str):
+        scenario_bot.process_contents([
+            (golden_content, "golden.cfg", {"config_role": "golden"}),
+            (candidate_content, "candidate.cfg", {"config_role": "candidate"})
+        ])
+        return scenario_bot
+    return ingest
@@ -1,44 +1,6 @@
-import os
-import shutil
-from chat_logic import RAGChatbot
+from debug_common import setup_bot_with_dummy_configs
 
-# Clean up previous runs
-if os.path.exists("./chroma_db"):
-    shutil.rmtree("./chroma_db")
-
-# Create IDENTICAL dummy content
-cfg_content = """
-hostname Switch-Core
-!
-vlan 10
- name Sales
-vlan 20
- name Engineering
-!
-interface GigabitEthernet1/0/1
- description Uplink to Router
- switchport mode trunk
-!
-router ospf 1
- network 10.0.0.0 0.0.0.255 area 0
-"""
-
-# Save dummy files
-with open("golden.cfg", "w") as f:
-    f.write(cfg_content)
-
-with open("candidate.cfg", "w") as f:
-    f.write(cfg_content)
-
-# Initialize Chatbot
-bot = RAGChatbot(model_name="llama3.2:3b")
-
-# Process Files
-print("Processing Golden Config...")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-
-print("Processing Candidate Config...")
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
+bot, filter_golden, filter_candidate = setup_bot_with_dummy_configs()
 
 # Debug: Check what chunks were created
 print("\n" + "="*80)
@@ -46,7 +8,6 @@ print("DEBUGGING: Examining stored chunks")
 print("="*80)
 
 # Query for all golden chunks
-filter_golden = {"config_role": "golden"}
 docs_golden = bot.ingestion.vector_store.similarity_search(
     "vlan interface router", 
     k=50, 
@@ -64,7 +25,6 @@ for i, doc in enumerate(docs_golden, 1):
     print(f"  Content:\n{doc.page_content}")
 
 # Query for all candidate chunks
-filter_candidate = {"config_role": "candidate"}
 docs_candidate = bot.ingestion.vector_store.similarity_search(
     "vlan interface router", 
     k=50, 
@@ -108,7 +68,3 @@ for i, doc in enumerate(docs_golden_compare, 1):
 print(f"\n🔍 CANDIDATE CHUNKS RETRIEVED FOR COMPARISON (Total: {len(docs_candidate_compare)}):")
 for i, doc in enumerate(docs_candidate_compare, 1):
     print(f"  {i}. {doc.metadata.get('parent_line', 'N/A')}")
-
-# Cleanup
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
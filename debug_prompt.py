@@ -1,51 +1,10 @@
-import os
-import shutil
-from chat_logic import RAGChatbot
+from debug_common import setup_bot_with_dummy_configs
 
-# Clean up previous runs
-if os.path.exists("./chroma_db"):
-    shutil.rmtree("./chroma_db")
-
-# Create IDENTICAL dummy content
-cfg_content = """
-hostname Switch-Core
-!
-vlan 10
- name Sales
-vlan 20
- name Engineering
-!
-interface GigabitEthernet1/0/1
- description Uplink to Router
- switchport mode trunk
-!
-router ospf 1
- network 10.0.0.0 0.0.0.255 area 0
-"""
-
-# Save dummy files
-with open("golden.cfg", "w") as f:
-    f.write(cfg_content)
-
-with open("candidate.cfg", "w") as f:
-    f.write(cfg_content)
-
-# Initialize Chatbot
-bot = RAGChatbot(model_name="llama3.2:3b")
-
-# Process Files
-print("Processing Golden Config...")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-
-print("Processing Candidate Config...")
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
+bot, filter_golden, filter_candidate = setup_bot_with_dummy_configs()
 
 # Debug: Manually build the comparison table to see what LLM receives
 query = "Compare 'candidate.cfg' against 'golden.cfg'. Focus on VLANs, Interfaces, and Routes."
 
-filter_golden = {"config_role": "golden"}
-filter_candidate = {"config_role": "candidate"}
-
 docs_golden = bot.ingestion.vector_store.similarity_search(
     query, 
     k=50, 
@@ -111,7 +70,3 @@ print("\n" + "="*80)
 print("FULL TABLE:")
 print("="*80)
 print(comparison_text)
-
-# Cleanup
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
@@ -1,19 +1,35 @@
+import os
+import sys
+import shutil
+import inspect
 import re
+import orjson
 import uuid
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+import functools
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
 from dataclasses import dataclass
 from langchain_chroma import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 # Import logger
-from utils import logger, compute_file_hash
+from utils import logger, compute_file_hash, compute_content_hash
+import parser_kernels
+from parser_kernels import segment_blocks, SKIP, PARENT, CHILD
 
 # -----------------------------------------------------------------------------
 # Configuration & Constants
 # -----------------------------------------------------------------------------
 
+# Local sentence-transformers model used for chunk and query embeddings
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
 # Supported Vendors/OS (for detection logic)
 VENDORS = {
     "cisco": ["ios", "ios-xe", "nx-os"],
@@ -34,21 +50,44 @@ SECRETS_PATTERNS = [
     (r'(password|secret) 5 [a-zA-Z0-9$]+', r'\1 5 [REDACTED]'),
     # SNMP Communities
     (r'(snmp-server community) [a-zA-Z0-9]+', r'\1 [REDACTED]'),
-    # TACACS/RADIUS Keys
-    (r'(key) [a-zA-Z0-9]+', r'\1 [REDACTED]'),
+    # TACACS/RADIUS Keys (type 7 keys are left to the next pattern, so the hash itself is redacted)
+    (r'(key) (?!7 [a-zA-Z0-9])[a-zA-Z0-9]+', r'\1 [REDACTED]'),
     (r'(key 7) [a-zA-Z0-9]+', r'\1 [REDACTED]'),
 ]
 
+# Compiled once; applied in order, since later patterns see earlier redactions
+_COMPILED_SECRETS = [(re.compile(pattern), replacement) for pattern, replacement in SECRETS_PATTERNS]
+
+# Union of all patterns: one scan rules out the (common) line with no secret.
+# Only a prefilter - a single fused substitution would not match the chained
+# semantics (e.g. "key password 7 x" must redact both "password" and "x").
+_SECRETS_ANY = re.compile("|".join(f"(?:{pattern})" for pattern, _ in SECRETS_PATTERNS))
+
+def _has_secret_hint(text: str) -> bool:
+    """
+    True if any redaction pattern could match somewhere in `text`: every pattern
+    needs one of these literals, and substring checks are far cheaper than a regex scan.
+    """
+    return "key" in text or "password" in text or "secret" in text or "community" in text
+
+HOSTNAME_LEN = len("hostname ")
+
+# Manual override for the parse cache key; the key also fingerprints the
+# redaction patterns and parser source, so code changes invalidate it by themselves
+PARSE_CACHE_VERSION = 1
+# Oldest (least recently used) parse cache entries are evicted beyond this
+PARSE_CACHE_MAX_ENTRIES = 1024
+
 # -----------------------------------------------------------------------------
 # AST Parser
 # -----------------------------------------------------------------------------
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ConfigBlock:
     full_text: str
     parent_line: str
     header_type: str
-    children: List[str]
+    children: Tuple[str, ...]
     line_start: int
     line_end: int
     has_secret: bool
@@ -63,6 +102,9 @@ class NetworkConfigParser:
         self.raw_content = content
         self.filename = filename
         self.lines = content.splitlines()
+        # Line table built in the same pass: (first char, first non-blank char).
+        # Classification reads these instead of re-stripping every line.
+        self._line_info = [(line[:1], line.lstrip()[:1]) for line in self.lines]
         self.blocks: List[ConfigBlock] = []
         self.metadata: Dict[str, Any] = self._detect_metadata()
 
@@ -76,127 +118,347 @@ class NetworkConfigParser:
         }
         
         # Simple heuristics
-        for line in self.lines[:50]: # Check first 50 lines
-            if "Current configuration :" in line:
-                meta["vendor"] = "cisco"
-                meta["os_family"] = "sugg_ios_xe"
-            if "version " in line.lower():
-                # Extract version info if needed
-                pass
+        head_lines = self.lines[:50] # Check first 50 lines
+        if "Current configuration :" in "\n".join(head_lines):
+            meta["vendor"] = "cisco"
+            meta["os_family"] = "sugg_ios_xe"
+
+        # Last hostname line wins, as before
+        for line in reversed(head_lines):
             if line.startswith("hostname "):
-                meta["hostname"] = line.split("hostname ")[1].strip()
+                meta["hostname"] = line[HOSTNAME_LEN:].strip()
+                break
 
         return meta
 
-    def _is_child(self, line: str) -> bool:
-        """Determines if a line is a child (indented or specialized)."""
-        return line.startswith(" ") or line.startswith("\t")
+    def _is_child(self, first: str) -> bool:
+        """Determines if a line is a child (indented), from its first character."""
+        return first in (" ", "\t")
 
     def _redact_line(self, line: str) -> (str, bool):
         """Redacts secrets from a single line."""
+        if not _has_secret_hint(line) or not _SECRETS_ANY.search(line):
+            return line, False
+
         found_secret = False
         redacted_line = line
-        for pattern, replacement in SECRETS_PATTERNS:
-            new_line = re.sub(pattern, replacement, redacted_line)
-            if new_line != redacted_line:
+        for pattern, replacement in _COMPILED_SECRETS:
+            redacted_line, count = pattern.subn(replacement, redacted_line)
+            if count:
                 found_secret = True
-                redacted_line = new_line
         return redacted_line, found_secret
 
+    def _line_kind(self, first: str, lead: str) -> int:
+        """SKIP (empty/banner), PARENT or CHILD, from the line table entry."""
+        if not lead or lead == "!":
+            return SKIP
+        return CHILD if self._is_child(first) else PARENT
+
     def parse(self) -> List[ConfigBlock]:
-        """Main parsing logic."""
-        current_block_lines = []
-        current_parent = None
-        block_start = 0
-        has_secret_in_block = False
-
-        for i, line in enumerate(self.lines):
-            stripped = line.strip()
-            
-            # Skip empty lines or banners (simple filter)
-            if not stripped or stripped.startswith("!"):
-                continue
+        """
+        Main parsing logic. Lines are classified in one pass; block boundaries
+        then come from the (optionally JIT-compiled) segment_blocks kernel
+        instead of a per-line state machine.
+        """
+        lines = self.lines
+        kinds = np.fromiter(
+            (self._line_kind(first, lead) for first, lead in self._line_info),
+            dtype=np.int8,
+            count=len(lines)
+        )
 
-            # Redaction
-            safe_line, detected_secret = self._redact_line(line)
-            if detected_secret:
-                has_secret_in_block = True
-
-            if not self._is_child(line):
-                # New Parent Block Found
-                if current_parent:
-                    # Save previous block
-                    self._commit_block(current_parent, current_block_lines, block_start, i-1, has_secret_in_block)
-                
-                # Reset for new block
-                current_parent = safe_line
-                current_block_lines = [safe_line]
-                block_start = i
-                has_secret_in_block = detected_secret
-            else:
-                # Child line
-                current_block_lines.append(safe_line)
-
-        # Commit last block
-        if current_parent:
-             self._commit_block(current_parent, current_block_lines, block_start, len(self.lines), has_secret_in_block)
+        parent_rows, end_rows = segment_blocks(kinds)
+        if not parent_rows.size:
+            return self.blocks
+        kept_rows = np.flatnonzero(kinds)
+
+        # Each parent's position among the kept lines starts its block;
+        # children before the first parent belong to no block and are dropped.
+        bounds = np.searchsorted(kept_rows, parent_rows).tolist() + [len(kept_rows)]
+        ends = end_rows.tolist()
+        first = bounds[0]
+
+        # Redaction runs once over the kept lines; a file without any hint skips it outright
+        kept_lines = [lines[row] for row in kept_rows[first:].tolist()]
+        if _has_secret_hint(self.raw_content):
+            redacted = [self._redact_line(line) for line in kept_lines]
+        else:
+            redacted = [(line, False) for line in kept_lines]
+
+        for j, start in enumerate(parent_rows.tolist()):
+            block = redacted[bounds[j] - first:bounds[j + 1] - first]
+            block_lines = [safe_line for safe_line, _ in block]
+            has_secret = any(detected for _, detected in block)
+            self._commit_block(block_lines[0], block_lines, start, ends[j], has_secret)
 
         return self.blocks
 
     def _commit_block(self, parent: str, lines: List[str], start: int, end: int, has_secret: bool):
         """Creates a ConfigBlock object."""
-        # Determine basic type
-        header_type = parent.split()[0] if parent else "global"
+        # Determine basic type: first token, interned (a config has only a few dozen distinct ones)
+        if parent:
+            header_type = parent.partition(" ")[0]
+            if "\t" in header_type: # Tab-separated header, same token split() would give
+                header_type = header_type.split(maxsplit=1)[0]
+            header_type = sys.intern(header_type)
+        else:
+            header_type = "global"
         
-        full_text = "\n".join(lines)
+        # Single-line blocks reuse the parent string instead of joining a copy
+        full_text = parent if len(lines) == 1 else "\n".join(lines)
         
         block = ConfigBlock(
             full_text=full_text,
             parent_line=parent,
             header_type=header_type,
-            children=lines[1:],
+            children=tuple(lines[1:]),
             line_start=start,
             line_end=end,
             has_secret=has_secret
         )
         self.blocks.append(block)
 
+# -----------------------------------------------------------------------------
+# Embedding Cache
+# -----------------------------------------------------------------------------
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a bounded LRU cache for query embeddings.
+    Repeated questions (e.g. the canned compare prompts) skip model inference.
+    """
+
+    def __init__(self, inner: Embeddings, max_size: int = 1024):
+        self.inner = inner
+        self.max_size = max_size
+        # Part of the key so vectors from different embedders never mix
+        self.model_name = getattr(inner, "model_name", type(inner).__name__)
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Documents are embedded once at ingest time, so they bypass the cache."""
+        return self.inner.embed_documents(texts)
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Collapses whitespace; the tokenizer splits on it, so the embedding is unchanged."""
+        return " ".join(text.split())
+
+    def embed_query(self, text: str) -> List[float]:
+        text = self.normalize_query(text)
+        key = hashlib.blake2b(f"{self.model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+                return vector
+
+        vector = self.inner.embed_query(text)
+
+        with self._lock:
+            self._cache_misses += 1
+            self._cache[key] = vector
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Returns cache hit/miss counters."""
+        total = self._cache_hits + self._cache_misses
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "size": len(self._cache),
+            "hit_rate": round(self._cache_hits / total, 3) if total else 0.0
+        }
+
+class FastEmbeddings(HuggingFaceEmbeddings):
+    """
+    HuggingFaceEmbeddings whose embed_documents tokenizes every text in one
+    tokenizer call (SentenceTransformer.encode tokenizes batch by batch), then
+    pads and runs the model `batch_size` texts at a time. Vectors match encode()
+    with the same encode_kwargs.
+    """
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        import torch
+
+        if not texts:
+            return []
+        model = self.client
+        tokenizer = model.tokenizer
+        batch_size = self.encode_kwargs.get("batch_size", 32)
+
+        # Same text preparation as HuggingFaceEmbeddings + SentenceTransformer.tokenize
+        texts = [text.replace("\n", " ").strip() for text in texts]
+        encoded = tokenizer(texts, truncation="longest_first", max_length=model.max_seq_length)
+        rows = [dict(zip(encoded.keys(), values)) for values in zip(*encoded.values())]
+        # Smart batching: rows sorted by token count, so each batch pads to a similar length
+        order = sorted(range(len(rows)), key=lambda i: len(rows[i]["input_ids"]))
+
+        vectors = []
+        with torch.inference_mode():
+            for start in range(0, len(rows), batch_size):
+                # Padded to the longest text of this batch only
+                batch = [rows[i] for i in order[start:start + batch_size]]
+                features = tokenizer.pad(batch, return_tensors="pt")
+                features = {key: value.to(model.device) for key, value in features.items()}
+                embeddings = model(features)["sentence_embedding"].float()
+                if self.encode_kwargs.get("normalize_embeddings"):
+                    embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+                vectors.append(embeddings.cpu())
+
+        # Back to input order
+        sorted_vectors = torch.cat(vectors).numpy().tolist()
+        result = [None] * len(rows)
+        for i, vector in zip(order, sorted_vectors):
+            result[i] = vector
+        return result
+
+@functools.lru_cache(maxsize=4)
+def load_embeddings(model_name: str = EMBEDDING_MODEL) -> CachedEmbeddings:
+    """
+    Loads an embedding model once per process. Every IngestionEngine (and every
+    chatbot / Streamlit session built on one) shares the same weights, tokenizer
+    and query cache.
+    """
+    import torch
+
+    # bf16 weights/activations on CUDA halve memory traffic; CPU stays fp32
+    use_bf16 = torch.cuda.is_available()
+    model_kwargs = {"model_kwargs": {"torch_dtype": torch.bfloat16}} if use_bf16 else {}
+
+    logger.info(f"Loading embedding model: {model_name}" + (" (bf16)" if use_bf16 else ""))
+    inner = FastEmbeddings(
+        model_name=model_name,
+        model_kwargs=model_kwargs,
+        # Larger encode batches for bulk ingestion; unit vectors for cosine scoring
+        encode_kwargs={"batch_size": 128, "normalize_embeddings": True}
+    )
+    if use_bf16:
+        _upcast_pooling(inner.client)
+    return CachedEmbeddings(inner)
+
+def _upcast_pooling(model):
+    """
+    Casts token embeddings to float32 before the pooling module, so mean-pooling
+    and normalization don't accumulate in bf16.
+    """
+    from sentence_transformers.models import Pooling
+
+    def _to_fp32(module, args):
+        features = args[0]
+        return ({**features, "token_embeddings": features["token_embeddings"].float()},)
+
+    for module in model:
+        if isinstance(module, Pooling):
+            module.register_forward_pre_hook(_to_fp32)
+
 # -----------------------------------------------------------------------------
 # Vector Store Ingestion
 # -----------------------------------------------------------------------------
 
+def _read_file(file_path: str) -> Optional[bytes]:
+    """Raw bytes of a file, or None if it can't be read (I/O-bound; thread-safe)."""
+    try:
+        with open(file_path, "rb") as f:
+            return f.read()
+    except Exception as e:
+        logger.error(f"Failed to read file {file_path}: {e}")
+        return None
+
+def _parse_content(raw: bytes, filename: str) -> Tuple[List[ConfigBlock], Dict[str, Any], str]:
+    """
+    Decodes, parses/redacts and hashes one file: (blocks, file_meta, file_hash).
+    """
+    parser = NetworkConfigParser(raw.decode("utf-8", errors="ignore"), filename)
+    blocks = parser.parse()
+    return blocks, parser.metadata, compute_file_hash(raw) # Same key persist_upload derives from the upload
+
+def _parse_cache_key() -> Optional[str]:
+    """
+    Fingerprint of everything that shapes a parse result: the redaction patterns
+    and the parser / segmentation source. None disables the parse cache when the
+    source can't be read (e.g. a frozen build), so stale blocks are never trusted.
+    """
+    try:
+        sources = [inspect.getsource(obj) for obj in (ConfigBlock, NetworkConfigParser, _has_secret_hint, parser_kernels)]
+    except (OSError, TypeError):
+        return None
+    fingerprint = compute_file_hash(orjson.dumps([PARSE_CACHE_VERSION, SECRETS_PATTERNS, sources]))
+    return f"v{PARSE_CACHE_VERSION}-{fingerprint[:16]}"
+
+PARSE_CACHE_KEY = _parse_cache_key()
+
 class IngestionEngine:
-    def __init__(self, persist_directory="./chroma_db"):
+    def __init__(self, persist_directory="./chroma_db", embeddings: Embeddings = None,
+                 collection_name: str = "network_configs"):
         self.persist_directory = persist_directory
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        self.collection_name = collection_name
+        self.embeddings = embeddings or load_embeddings()
         self.vector_store = Chroma(
             persist_directory=self.persist_directory,
             embedding_function=self.embeddings,
-            collection_name="network_configs"
+            collection_name=collection_name
         )
+        # Bumped on every successful index so response caches can invalidate
+        self.corpus_version = 0
+        self._version_lock = threading.Lock() # Files may be ingested from several threads
+        # Sidecar of pre-grouped blocks per (source, role), used by compare_configs
+        self.block_index_dir = os.path.join(self.persist_directory, "block_index", collection_name)
+        self._block_indexes: Dict[tuple, Dict[str, Any]] = {}
+        # Parsed blocks per file hash, shared by every collection under this directory
+        parse_cache_root = os.path.join(self.persist_directory, "parse_cache")
+        self.parse_cache_dir = os.path.join(parse_cache_root, PARSE_CACHE_KEY) if PARSE_CACHE_KEY else None
+        self._drop_stale_parse_caches(parse_cache_root)
 
-    def process_file(self, file_path: str, extra_metadata: Dict[str, Any] = None):
-        """Reads, parses, and indexes a file."""
+    def _prepare_file(self, file_path: str, extra_metadata: Dict[str, Any] = None, filename: str = None,
+                      raw: bytes = None):
+        """
+        Reads one file (unless its bytes are given) and hands them to _prepare_content.
+        Returns None if the file is unreadable or empty.
+        """
         logger.info(f"Processing file: {file_path}")
         
-        # 1. Read File
-        try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-        except Exception as e:
-            logger.error(f"Failed to read file {file_path}: {e}")
-            return False
-
-        # 2. Parse (AST)
-        parser = NetworkConfigParser(content, file_path.split("/")[-1])
-        blocks = parser.parse()
-        file_meta = parser.metadata
-
-        # 3. Convert to Documents
-        documents = []
-        for block in blocks:
+        # 1. Read File (raw bytes once: hashed as-is, then decoded for parsing)
+        if raw is None:
+            raw = _read_file(file_path)
+        if raw is None:
+            return None
+        return self._prepare_content(raw, filename or file_path.split("/")[-1], extra_metadata, file_path)
+
+    def _prepare_content(self, content: Union[str, bytes], filename: str, extra_metadata: Dict[str, Any] = None,
+                         label: str = None):
+        """
+        Parses in-memory config content into parallel (texts, metadatas, ids) plus its
+        blocks; _index_prepared writes the block index once the chunks are stored.
+        Returns None if there is nothing to index.
+        """
+        # Hash the encoded text so it keys the same as the file's bytes would
+        raw = content.encode("utf-8") if isinstance(content, str) else content
+
+        # 2. Parse (AST), unless this exact content was parsed before
+        parsed = self._load_parsed(compute_file_hash(raw), filename)
+        if parsed is None:
+            parsed = _parse_content(raw, filename)
+            self._save_parsed(parsed)
+        return self._build_chunks(label or filename, parsed, extra_metadata)
+
+    def _build_chunks(self, file_path: str, parsed: tuple, extra_metadata: Dict[str, Any] = None):
+        """Turns parsed blocks into parallel (texts, metadatas, ids), plus the blocks for the block index."""
+        blocks, file_meta, file_hash = parsed
+
+        # 3. Build parallel texts / metadata / deterministic IDs
+        role = (extra_metadata or {}).get("config_role", "none")
+
+        texts = []
+        metadatas = []
+        ids = []
+        for i, block in enumerate(blocks):
             # Construct rich metadata
             meta = {
                 "source": file_meta["filename"],
@@ -206,31 +468,365 @@ class IngestionEngine:
                 "line_start": block.line_start,
                 "line_end": block.line_end,
                 "has_secret": block.has_secret,
-                "parent_line": block.parent_line
+                "parent_line": block.parent_line,
+                "file_hash": file_hash,
+                "content_hash": compute_content_hash(block.full_text)
             }
             
             # Merge extra_metadata if provided
             if extra_metadata:
                 meta.update(extra_metadata)
             
-            # Create Document
-            doc = Document(
-                page_content=block.full_text,
-                metadata=meta
+            texts.append(block.full_text)
+            metadatas.append(meta)
+            # Same content + file + role => same ID, so re-uploads are idempotent
+            ids.append(f"{file_hash}:{role}:{file_meta['filename']}:{i}")
+
+        logger.info(f"Generated {len(texts)} chunks for {file_path}")
+
+        if not texts:
+            return None
+
+        return texts, metadatas, ids, blocks
+
+    def process_file(self, file_path: str, extra_metadata: Dict[str, Any] = None, filename: str = None):
+        """
+        Reads, parses, and indexes a file.
+        `filename` overrides the `source` name stored in metadata (defaults to the path's basename).
+        """
+        return self.process_files([(file_path, extra_metadata, filename)])[0]
+
+    def process_content(self, content: Union[str, bytes], filename: str, extra_metadata: Dict[str, Any] = None) -> bool:
+        """
+        Parses and indexes config content that is already in memory (no file round-trip).
+        `filename` is stored as the `source` name.
+        """
+        return self.process_contents([(content, filename, extra_metadata)])[0]
+
+    def process_contents(self, content_specs: List[tuple], batch_size: int = 128) -> List[bool]:
+        """
+        process_files for in-memory content: each spec is (content, filename, extra_metadata).
+        Returns one success flag per spec.
+        """
+        prepared = [self._prepare_content(*spec) for spec in content_specs]
+        return self._index_prepared([spec[1] for spec in content_specs], prepared, batch_size)
+
+    def process_files(self, file_specs: List[tuple], batch_size: int = 128) -> List[bool]:
+        """
+        Indexes several files with one embedding pass.
+        Each spec is (file_path, extra_metadata) or (file_path, extra_metadata, filename).
+        All files are parsed first; chunks whose IDs are not yet in the collection
+        are then embedded in one call and upserted `batch_size` at a time.
+        Returns one success flag per spec.
+        """
+        prepared = [self._prepare_file(*spec) for spec in file_specs]
+        return self._index_prepared([spec[0] for spec in file_specs], prepared, batch_size)
+
+    def ingest_many(self, file_specs: List[tuple], io_workers: int = 8, batch_size: int = 128) -> List[bool]:
+        """
+        process_files for large batches: files are read concurrently on threads,
+        then parsed (or served from the parse cache) and indexed in one embedding pass.
+        Parsing stays in this process: configs parse in milliseconds, far less
+        than a worker process would spend importing the embedding stack.
+        """
+        with ThreadPoolExecutor(max_workers=io_workers) as pool:
+            raws = list(pool.map(_read_file, [spec[0] for spec in file_specs]))
+
+        prepared = [
+            self._prepare_file(*spec, raw=raw) if raw is not None else None
+            for spec, raw in zip(file_specs, raws)
+        ]
+        return self._index_prepared([spec[0] for spec in file_specs], prepared, batch_size)
+
+    def _index_prepared(self, labels: List[str], prepared: List[Optional[tuple]], batch_size: int) -> List[bool]:
+        """
+        Steps 4-5 for already parsed files: skip known chunks, embed and upsert the rest.
+        `labels` (paths or filenames) are only used for logging.
+        """
+        results = [chunks is not None for chunks in prepared]
+        prepared_files = [(label, chunks) for label, chunks in zip(labels, prepared) if chunks is not None]
+
+        if not prepared_files:
+            return results
+
+        # 4. One existence check for every chunk of every file. IDs are derived
+        # from content, so a present ID is an identical row: never rewritten.
+        existing = set(self.vector_store._collection.get(
+            ids=[chunk_id for _, (_, _, file_ids, _) in prepared_files for chunk_id in file_ids],
+            include=[]
+        )["ids"])
+
+        texts, metadatas, ids = [], [], []
+        for file_path, (file_texts, file_metadatas, file_ids, _) in prepared_files:
+            missing = [i for i, chunk_id in enumerate(file_ids) if chunk_id not in existing]
+            if not missing:
+                logger.info(f"Already indexed, skipping embedding: {file_path}")
+                continue
+            texts.extend(file_texts[i] for i in missing)
+            metadatas.extend(file_metadatas[i] for i in missing)
+            ids.extend(file_ids[i] for i in missing)
+
+        # Rows left by an earlier version of the same (source, role): re-ingesting
+        # an edited config replaces it instead of piling up next to it
+        stale_ids, stale_versions = self._stale_chunks([file_metadatas[0] for _, (_, file_metadatas, _, _) in prepared_files])
+
+        if texts or stale_ids:
+            self._upsert_and_prune(texts, metadatas, ids, stale_ids, batch_size)
+            for source, role, file_hash in stale_versions:
+                self._drop_block_index(source, role, file_hash)
+
+        # Block indexes only once their chunks are in Chroma, so a failed
+        # upsert never leaves an index pointing at blocks that aren't stored
+        for _, (_, file_metadatas, _, blocks) in prepared_files:
+            meta = file_metadatas[0]
+            self._save_block_index(meta["source"], meta.get("config_role", "none"), meta["file_hash"], blocks)
+        return results
+
+    def _upsert_and_prune(self, texts: List[str], metadatas: List[Dict[str, Any]], ids: List[str],
+                          stale_ids: List[str], batch_size: int):
+        """
+        5. Index: each distinct chunk embedded once, vectors handed straight to Chroma.
+        Runs before the stale rows go, so unchanged blocks reuse their old vectors.
+        """
+        collection = self.vector_store._collection
+        if texts:
+            vectors = self._embed_with_reuse(texts, metadatas)
+            for start in range(0, len(texts), batch_size):
+                end = start + batch_size
+                collection.upsert(
+                    ids=ids[start:end],
+                    embeddings=vectors[start:end],
+                    documents=texts[start:end],
+                    metadatas=metadatas[start:end]
+                )
+            logger.info(f"Indexed {len(texts)} chunks successfully.")
+        if stale_ids:
+            collection.delete(ids=stale_ids)
+            logger.info(f"Removed {len(stale_ids)} chunks of superseded file versions.")
+        with self._version_lock:
+            self.corpus_version += 1
+
+    def _stale_chunks(self, file_metadatas: List[Dict[str, Any]]) -> tuple:
+        """
+        IDs of stored chunks with the same source and role as a file being indexed
+        but a file_hash not indexed in this batch, plus the (source, role, file_hash)
+        versions they belong to. Files without a config_role are left alone.
+        """
+        hashes_by_file: Dict[tuple, set] = {}
+        for meta in file_metadatas:
+            if "config_role" in meta:
+                hashes_by_file.setdefault((meta["source"], meta["config_role"]), set()).add(meta["file_hash"])
+
+        filters = [
+            {"$and": [
+                {"source": source},
+                {"config_role": role},
+                {"file_hash": {"$nin": sorted(hashes)}}
+            ]}
+            for (source, role), hashes in hashes_by_file.items()
+        ]
+        if not filters:
+            return [], set()
+        where = filters[0] if len(filters) == 1 else {"$or": filters}
+        stale = self.vector_store._collection.get(where=where, include=["metadatas"])
+        versions = {
+            (meta["source"], meta["config_role"], meta["file_hash"])
+            for meta in stale["metadatas"] if meta
+        }
+        return stale["ids"], versions
+
+    def _embed_with_reuse(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> List[List[float]]:
+        """
+        Embeds each distinct text once. Text already stored in the collection
+        (same content under another role or file) reuses its stored vector;
+        candidates are found by content_hash and confirmed by exact text match.
+        """
+        vectors: Dict[str, List[float]] = {}
+        hashes = list({meta["content_hash"] for meta in metadatas})
+        stored = self.vector_store._collection.get(
+            where={"content_hash": {"$in": hashes}},
+            include=["documents", "embeddings"]
+        )
+        for text, vector in zip(stored["documents"], stored["embeddings"]):
+            vectors.setdefault(text, list(vector))
+
+        new_texts = [text for text in dict.fromkeys(texts) if text not in vectors]
+        # One call: the embedder batches internally (FastEmbeddings tokenizes all texts at once)
+        if new_texts:
+            vectors.update(zip(new_texts, self.embeddings.embed_documents(new_texts)))
+
+        logger.info(f"Embedded {len(new_texts)} new chunks, reused {len(texts) - len(new_texts)}.")
+        return [vectors[text] for text in texts]
+
+    def _drop_stale_parse_caches(self, parse_cache_root: str):
+        """Removes parse caches written by other parser / redaction versions."""
+        try:
+            entries = list(os.scandir(parse_cache_root))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir() and entry.path != self.parse_cache_dir:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _evict_parsed(self):
+        """Keeps the parse cache at PARSE_CACHE_MAX_ENTRIES, dropping the least recently used."""
+        entries = [entry for entry in os.scandir(self.parse_cache_dir) if entry.name.endswith(".json")]
+        excess = len(entries) - PARSE_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def _parse_cache_path(self, file_hash: str) -> str:
+        return os.path.join(self.parse_cache_dir, f"{file_hash}.json")
+
+    def _save_parsed(self, parsed: tuple):
+        """
+        Persists one parse result column-wise (one list per ConfigBlock field) under its file hash.
+        Children are not stored: they are the full_text lines after the parent.
+        """
+        if self.parse_cache_dir is None:
+            return
+        blocks, file_meta, file_hash = parsed
+        entry = {
+            "metadata": {key: value for key, value in file_meta.items() if key != "filename"},
+            "blocks": {
+                "full_text": [block.full_text for block in blocks],
+                "parent_line": [block.parent_line for block in blocks],
+                "header_type": [block.header_type for block in blocks],
+                "line_start": [block.line_start for block in blocks],
+                "line_end": [block.line_end for block in blocks],
+                "has_secret": [block.has_secret for block in blocks]
+            }
+        }
+        try:
+            os.makedirs(self.parse_cache_dir, exist_ok=True)
+            path = self._parse_cache_path(file_hash)
+            tmp_path = f"{path}.{os.getpid()}.partial"
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(entry))
+            os.replace(tmp_path, path)
+            self._evict_parsed()
+        except OSError as e:
+            logger.warning(f"Could not persist parse cache for {file_meta['filename']}: {e}")
+
+    def _load_parsed(self, file_hash: str, filename: str) -> Optional[tuple]:
+        """(blocks, file_meta, file_hash) from the parse cache, or None on a miss."""
+        if self.parse_cache_dir is None:
+            return None
+        path = self._parse_cache_path(file_hash)
+        try:
+            with open(path, "rb") as f:
+                entry = orjson.loads(f.read())
+            os.utime(path) # Recently used: evicted last
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+        columns = entry["blocks"]
+        blocks = [
+            ConfigBlock(
+                full_text=full_text,
+                parent_line=parent_line,
+                header_type=sys.intern(header_type),
+                children=tuple(full_text.split("\n")[1:]),
+                line_start=line_start,
+                line_end=line_end,
+                has_secret=has_secret
             )
-            documents.append(doc)
+            for full_text, parent_line, header_type, line_start, line_end, has_secret in zip(
+                columns["full_text"], columns["parent_line"], columns["header_type"],
+                columns["line_start"], columns["line_end"], columns["has_secret"]
+            )
+        ]
+        return blocks, {**entry["metadata"], "filename": filename}, file_hash
+
+    def _block_index_path(self, source: str, role: str, file_hash: str) -> str:
+        return os.path.join(
+            self.block_index_dir,
+            f"{role}_{compute_file_hash(source.encode('utf-8'))}_{file_hash}.json"
+        )
 
-        logger.info(f"Generated {len(documents)} chunks for {file_path}")
+    def _save_block_index(self, source: str, role: str, file_hash: str, blocks: List[ConfigBlock]):
+        """Persists {parent_line: block info} for one file version so compares never regroup chunks."""
+        key = (source, role, file_hash)
+        path = self._block_index_path(source, role, file_hash)
+        if key in self._block_indexes and os.path.exists(path):
+            return
 
-        # 4. Filter existing (Simple deduplication logic could go here)
-        # For now, we assume overwrite or append.
-        
-        # 5. Index
-        if documents:
-            self.vector_store.add_documents(documents)
-            logger.info("Indexed successfully.")
-            return True
-        return False
+        index = {
+            "file_hash": file_hash,
+            "blocks": {
+                block.parent_line: {
+                    "content": block.full_text.strip(), # Pre-stripped once here
+                    "content_hash": compute_content_hash(block.full_text),
+                    "section_type": block.header_type,
+                    "line_start": block.line_start,
+                    "line_end": block.line_end
+                }
+                for block in blocks
+            }
+        }
+        self._block_indexes[key] = index
+
+        try:
+            os.makedirs(self.block_index_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.partial"
+            with open(tmp_path, "wb") as f:
+                f.write(orjson.dumps(index))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist block index for {source}: {e}")
+
+    def _drop_block_index(self, source: str, role: str, file_hash: str):
+        """Forgets the block index of a file version whose chunks were removed."""
+        self._block_indexes.pop((source, role, file_hash), None)
+        try:
+            os.remove(self._block_index_path(source, role, file_hash))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove block index for {source}: {e}")
+
+    def _load_block_index(self, source: str, role: str, file_hash: str) -> Optional[Dict[str, Any]]:
+        key = (source, role, file_hash)
+        index = self._block_indexes.get(key)
+        if index is None:
+            try:
+                with open(self._block_index_path(source, role, file_hash), "rb") as f:
+                    index = orjson.loads(f.read())
+            except (OSError, orjson.JSONDecodeError):
+                return None
+            self._block_indexes[key] = index
+        return index
+
+    def get_block_index(self, source: str, role: str,
+                        file_hash: str = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Returns {parent_line: {content, content_hash, section_type, line_start, line_end}} or None.
+        `file_hash` defaults to the version currently indexed for (source, role).
+        """
+        if file_hash is None:
+            file_hash = self.get_file_hash(source, role)
+            if file_hash is None:
+                return None
+        index = self._load_block_index(source, role, file_hash)
+        return index["blocks"] if index is not None else None
+
+    def get_file_hash(self, source: str, role: str) -> Optional[str]:
+        """Content hash of the indexed file for (source, role), or None if not indexed."""
+        # Superseded versions are deleted on re-ingest, so one metadata row is enough
+        data = self.vector_store.get(
+            where={"$and": [{"config_role": role}, {"source": source}]},
+            limit=1,
+            include=["metadatas"]
+        )
+        if data["metadatas"]:
+            return (data["metadatas"][0] or {}).get("file_hash")
+        return None
 
     def get_retriever(self):
         """Returns the retriever interface."""
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Numba is optional: when it is installed the segmentation scan is JIT-compiled
+# (and cached on disk), otherwise the equivalent NumPy version is used.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Line categories produced by NetworkConfigParser._line_kind
+SKIP, PARENT, CHILD = 0, 1, 2
+
+def _segment_blocks_numpy(kinds: np.ndarray):
+    starts = np.flatnonzero(kinds == PARENT)
+    ends = np.empty(len(starts), dtype=np.int64)
+    if len(starts):
+        ends[:-1] = starts[1:] - 1
+        ends[-1] = len(kinds)
+    return starts, ends
+
+def _segment_blocks_scan(kinds):
+    """
+    Single scan over the line categories.
+    Returns (starts, ends): the parent row of each block and its last row
+    (the row before the next parent; len(kinds) for the final block).
+    """
+    n = kinds.shape[0]
+    starts = np.empty(n, dtype=np.int64)
+    count = 0
+    for i in range(n):
+        if kinds[i] == PARENT:
+            starts[count] = i
+            count += 1
+    starts = starts[:count]
+
+    ends = np.empty(count, dtype=np.int64)
+    for j in range(count - 1):
+        ends[j] = starts[j + 1] - 1
+    if count:
+        ends[count - 1] = n
+    return starts, ends
+
+if njit is not None:
+    segment_blocks = njit(cache=True)(_segment_blocks_scan)
+else:
+    segment_blocks = _segment_blocks_numpy
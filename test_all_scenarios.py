@@ -1,21 +1,7 @@
 import os
-import shutil
-from chat_logic import RAGChatbot
+import pytest
 
-# Clean up previous runs
-if os.path.exists("./chroma_db"):
-    shutil.rmtree("./chroma_db")
-
-print("="*80)
-print("COMPREHENSIVE COMPARISON TESTS")
-print("="*80)
-
-# Test 1: Identical Configs (Should be ALL MATCH)
-print("\n" + "="*80)
-print("TEST 1: IDENTICAL CONFIGS")
-print("="*80)
-
-golden_content = """
+GOLDEN_CONTENT = """
 hostname Switch-Core
 !
 vlan 10
@@ -31,32 +17,7 @@ router ospf 1
  network 10.0.0.0 0.0.0.255 area 0
 """
 
-with open("golden.cfg", "w") as f:
-    f.write(golden_content)
-with open("candidate.cfg", "w") as f:
-    f.write(golden_content)
-
-bot = RAGChatbot(model_name="llama3.2:3b")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
-
-query = "Compare 'candidate.cfg' against 'golden.cfg'. Focus on VLANs, Interfaces, and Routes."
-response = bot.compare_configs(query)
-
-print("\nRESULT:")
-print(response["result"])
-print("\nExpected: All features should show ✅ MATCH")
-
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
-shutil.rmtree("./chroma_db")
-
-# Test 2: Missing VLAN in Candidate
-print("\n" + "="*80)
-print("TEST 2: MISSING VLAN IN CANDIDATE")
-print("="*80)
-
-candidate_content = """
+MISSING_VLAN_CONTENT = """
 hostname Switch-Core
 !
 vlan 10
@@ -70,32 +31,7 @@ router ospf 1
  network 10.0.0.0 0.0.0.255 area 0
 """
 
-with open("golden.cfg", "w") as f:
-    f.write(golden_content)
-with open("candidate.cfg", "w") as f:
-    f.write(candidate_content)
-
-# Reinitialize bot with fresh vector store
-bot = RAGChatbot(model_name="llama3.2:3b")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
-
-response = bot.compare_configs(query)
-
-print("\nRESULT:")
-print(response["result"])
-print("\nExpected: vlan 10 = MATCH, vlan 20 = MISSING, interface = MATCH, router = MATCH")
-
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
-shutil.rmtree("./chroma_db")
-
-# Test 3: Extra VLAN in Candidate
-print("\n" + "="*80)
-print("TEST 3: EXTRA VLAN IN CANDIDATE")
-print("="*80)
-
-candidate_content = """
+EXTRA_VLAN_CONTENT = """
 hostname Switch-Core
 !
 vlan 10
@@ -113,31 +49,7 @@ router ospf 1
  network 10.0.0.0 0.0.0.255 area 0
 """
 
-with open("golden.cfg", "w") as f:
-    f.write(golden_content)
-with open("candidate.cfg", "w") as f:
-    f.write(candidate_content)
-
-bot = RAGChatbot(model_name="llama3.2:3b")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
-
-response = bot.compare_configs(query)
-
-print("\nRESULT:")
-print(response["result"])
-print("\nExpected: vlan 10 = MATCH, vlan 20 = MATCH, vlan 30 = EXTRA, interface = MATCH, router = MATCH")
-
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
-shutil.rmtree("./chroma_db")
-
-# Test 4: Modified VLAN Name
-print("\n" + "="*80)
-print("TEST 4: MODIFIED VLAN NAME")
-print("="*80)
-
-candidate_content = """
+MODIFIED_VLAN_CONTENT = """
 hostname Switch-Core
 !
 vlan 10
@@ -153,24 +65,74 @@ router ospf 1
  network 10.0.0.0 0.0.0.255 area 0
 """
 
-with open("golden.cfg", "w") as f:
-    f.write(golden_content)
-with open("candidate.cfg", "w") as f:
-    f.write(candidate_content)
-
-bot = RAGChatbot(model_name="llama3.2:3b")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
-
-response = bot.compare_configs(query)
-
-print("\nRESULT:")
-print(response["result"])
-print("\nExpected: vlan 10 = DIFF, vlan 20 = MATCH, interface = MATCH, router = MATCH")
-
-os.remove("golden.cfg")
-os.remove("candidate.cfg")
-
-print("\n" + "="*80)
-print("ALL TESTS COMPLETED")
-print("="*80)
+QUERY = "Compare 'candidate.cfg' against 'golden.cfg'. Focus on VLANs, Interfaces, and Routes."
+
+def test_identical_configs(ingest_configs):
+    # Expected: All features should show ✅ MATCH
+    bot = ingest_configs(GOLDEN_CONTENT, GOLDEN_CONTENT)
+    response = bot.compare_configs(QUERY)
+    print(response["result"])
+
+    assert "❌ MISSING" not in response["result"]
+    assert "➕ EXTRA" not in response["result"]
+    assert "⚠️ DIFF" not in response["result"]
+
+@pytest.mark.parametrize("candidate_content, parent, status", [
+    # Expected: vlan 10 = MATCH, vlan 20 = MISSING, interface = MATCH, router = MATCH
+    (MISSING_VLAN_CONTENT, "vlan 20", "❌ MISSING"),
+    # Expected: vlan 10 = MATCH, vlan 20 = MATCH, vlan 30 = EXTRA, interface = MATCH, router = MATCH
+    (EXTRA_VLAN_CONTENT, "vlan 30", "➕ EXTRA"),
+    # Expected: vlan 10 = DIFF, vlan 20 = MATCH, interface = MATCH, router = MATCH
+    (MODIFIED_VLAN_CONTENT, "vlan 10", "⚠️ DIFF"),
+], ids=["missing_vlan", "extra_vlan", "modified_vlan"])
+def test_vlan_differences(ingest_configs, candidate_content, parent, status):
+    bot = ingest_configs(GOLDEN_CONTENT, candidate_content)
+    response = bot.compare_configs(QUERY)
+    print(response["result"])
+
+    rows = [row for row in response["result"].splitlines() if f"| {parent} |" in row]
+    assert rows and status in rows[0]
+    assert response["result"].count("✅ MATCH") >= 2
+
+def test_quick_diff_from_block_index(ingest_configs, monkeypatch):
+    # Expected: with both files named, quick mode diffs the ingest-time block indexes
+    bot = ingest_configs(GOLDEN_CONTENT, MISSING_VLAN_CONTENT)
+    monkeypatch.setattr(bot, "_scan_both", lambda *args: pytest.fail("quick mode scanned Chroma"))
+    response = bot.compare_configs(QUERY, "golden.cfg", "candidate.cfg")
+    print(response["result"])
+
+    rows = [row for row in response["result"].splitlines() if "| vlan 20 |" in row]
+    assert rows and "❌ MISSING" in rows[0]
+    assert response["result"].count("✅ MATCH") >= 2
+
+def test_identical_files_short_circuit(ingest_configs):
+    # Expected: byte-identical files are answered from the file hashes alone
+    bot = ingest_configs(GOLDEN_CONTENT, GOLDEN_CONTENT)
+    response = bot.compare_configs(QUERY, "golden.cfg", "candidate.cfg")
+
+    assert "Identical Configurations" in response["result"]
+    assert response["model"] == "Deterministic Check"
+    assert response["source_documents"] == []
+
+def test_reingest_replaces_stale_version(ingest_configs):
+    # Expected: an edited candidate replaces its old chunks and block index
+    bot = ingest_configs(GOLDEN_CONTENT, GOLDEN_CONTENT)
+    engine = bot.ingestion
+    collection = engine.vector_store._collection
+    old_hash = engine.get_file_hash("candidate.cfg", "candidate")
+    old_ids = collection.get(
+        where={"$and": [{"source": "candidate.cfg"}, {"config_role": "candidate"}]}, include=[]
+    )["ids"]
+    old_index_path = engine._block_index_path("candidate.cfg", "candidate", old_hash)
+    assert old_ids and os.path.exists(old_index_path)
+
+    bot.process_contents([(EXTRA_VLAN_CONTENT, "candidate.cfg", {"config_role": "candidate"})])
+
+    assert engine.get_file_hash("candidate.cfg", "candidate") != old_hash
+    assert collection.get(ids=old_ids, include=[])["ids"] == []
+    assert not os.path.exists(old_index_path)
+    assert engine.get_block_index("candidate.cfg", "candidate", old_hash) is None
+
+    response = bot.compare_configs(QUERY, "golden.cfg", "candidate.cfg")
+    rows = [row for row in response["result"].splitlines() if "| vlan 30 |" in row]
+    assert rows and "➕ EXTRA" in rows[0]
@@ -0,0 +1,98 @@
+import dataclasses
+import numpy as np
+import pytest
+import ingestion
+import parser_kernels
+from ingestion import IngestionEngine, NetworkConfigParser
+from utils import compute_file_hash
+
+CONFIG = (
+    " orphan child before any parent\n"
+    "!\n"
+    "hostname Edge-1\n"
+    "!\n"
+    "interface GigabitEthernet0/1\n"
+    " description Uplink\n"
+    "\tip address 10.0.0.1 255.255.255.0\n"
+    " !\n"
+    "\n"
+    "router\tospf 1\n"
+    " network 10.0.0.0 0.0.0.255 area 0\n"
+    "# comment\n"
+    "line vty 0 4\n"
+    " password 7 0822455D0A16\n"
+    "enable secret 5 $1$mERr$hx5rVt7rPNoS4wqbXKX7m0\n"
+    "snmp-server community public RO\n"
+    "tacacs-server host 10.0.0.9\n"
+    " key MySecretKey\n"
+    "radius-server host 10.0.0.10\n"
+    " key 7 060506324F41\n"
+)
+
+# (parent_line, header_type, children, line_start, line_end, has_secret)
+EXPECTED_BLOCKS = [
+    # The orphan child and the '!' / blank lines belong to no block
+    ("hostname Edge-1", "hostname", (), 2, 3, False),
+    # Space- and tab-indented children; an indented '!' is skipped too
+    ("interface GigabitEthernet0/1", "interface",
+     (" description Uplink", "\tip address 10.0.0.1 255.255.255.0"), 4, 8, False),
+    # Tab-separated header: type is the first token
+    ("router\tospf 1", "router", (" network 10.0.0.0 0.0.0.255 area 0",), 9, 10, False),
+    # Only '!' lines are skipped; '#' lines are parents
+    ("# comment", "#", (), 11, 11, False),
+    ("line vty 0 4", "line", (" password 7 [REDACTED]",), 12, 13, True),
+    ("enable secret 5 [REDACTED]", "enable", (), 14, 14, True),
+    ("snmp-server community [REDACTED] RO", "snmp-server", (), 15, 15, True),
+    ("tacacs-server host 10.0.0.9", "tacacs-server", (" key [REDACTED]",), 16, 17, True),
+    ("radius-server host 10.0.0.10", "radius-server", (" key 7 [REDACTED]",), 18, 20, True),
+]
+
+def test_parse_blocks():
+    parser = NetworkConfigParser(CONFIG, "edge.cfg")
+    blocks = parser.parse()
+
+    assert [
+        (b.parent_line, b.header_type, b.children, b.line_start, b.line_end, b.has_secret)
+        for b in blocks
+    ] == EXPECTED_BLOCKS
+    assert all(b.full_text == "\n".join((b.parent_line,) + b.children) for b in blocks)
+    assert parser.metadata["hostname"] == "Edge-1"
+
+def test_config_block_is_immutable():
+    block = NetworkConfigParser(CONFIG, "edge.cfg").parse()[0]
+    assert not hasattr(block, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        block.parent_line = "hostname Other"
+
+@pytest.mark.parametrize("line, redacted", [
+    (" password 7 0822455D0A16", " password 7 [REDACTED]"),
+    ("enable secret 5 $1$mERr$hx5rVt7rPNoS4wqbXKX7m0", "enable secret 5 [REDACTED]"),
+    ("snmp-server community public RO", "snmp-server community [REDACTED] RO"),
+    (" key MySecretKey", " key [REDACTED]"),
+    (" key 7 060506324F41", " key 7 [REDACTED]"),
+    # Patterns chain: later ones see earlier redactions
+    ("tacacs-server key password 7 abc", "tacacs-server key [REDACTED] 7 [REDACTED]"),
+    # Hint literal without a secret: the prefilter passes it through untouched
+    (" description keyboard room", " description keyboard room"),
+])
+def test_redaction(line, redacted):
+    assert NetworkConfigParser("", "x.cfg")._redact_line(line) == (redacted, redacted != line)
+
+def test_segment_blocks_fallback_matches_scan():
+    kinds = np.array([2, 0, 1, 0, 1, 2, 2, 0, 0, 1, 2, 1, 1], dtype=np.int8)
+    starts, ends = parser_kernels._segment_blocks_numpy(kinds)
+    scan_starts, scan_ends = parser_kernels._segment_blocks_scan(kinds)
+    assert starts.tolist() == scan_starts.tolist() == [2, 4, 9, 11, 12]
+    assert ends.tolist() == scan_ends.tolist() == [3, 8, 10, 11, 13]
+
+def test_parse_cache_hit(tmp_path, monkeypatch):
+    engine = IngestionEngine(persist_directory=str(tmp_path))
+    assert engine.process_content(CONFIG, "edge.cfg")
+
+    # Same content again: served from the parse cache, never re-parsed
+    monkeypatch.setattr(ingestion, "_parse_content", lambda *args: pytest.fail("parsed twice"))
+    assert engine.process_content(CONFIG, "edge.cfg")
+
+    blocks, _, file_hash = engine._load_parsed(compute_file_hash(CONFIG.encode("utf-8")), "edge.cfg")
+    assert file_hash == compute_file_hash(CONFIG.encode("utf-8"))
+    assert blocks == NetworkConfigParser(CONFIG, "edge.cfg").parse()
@@ -0,0 +1,31 @@
+import pytest
+from chat_logic import SemanticCache
+
+VERSION = (0, "llama3.2:3b")
+
+@pytest.mark.parametrize("query, identifiers", [
+    # Sentence-initial capitals are not identifiers
+    ("What interfaces are up?", ()),
+    ("Which interfaces are up?", ()),
+    ("Show vlan 10.", ("10",)),
+    ("Status of GigabitEthernet1/0/1 and VLANs", ("GigabitEthernet1/0/1", "VLANs")),
+    ("Is route-map RM_OUT applied?", ("route-map", "RM_OUT")),
+    ("Who owns 10.0.0.1: the core?", ("10.0.0.1",)),
+])
+def test_identifiers(query, identifiers):
+    assert SemanticCache.identifiers(query) == identifiers
+
+def test_paraphrase_hits():
+    cache = SemanticCache(threshold=0.95)
+    cache.add("What interfaces are up?", [1.0, 0.0, 0.0], {"result": "up"}, VERSION)
+
+    # A rewording with no identifiers is served from the cache
+    assert cache.lookup("Which interfaces are up?", [0.99, 0.05, 0.0], VERSION) == {"result": "up"}
+
+def test_different_interface_misses():
+    cache = SemanticCache(threshold=0.95)
+    cache.add("Is Gi0/1 up?", [1.0, 0.0, 0.0], {"result": "Gi0/1 is up"}, VERSION)
+
+    # Near-identical embedding, but it names another interface
+    assert cache.lookup("Is Gi0/2 up?", [0.99, 0.05, 0.0], VERSION) is None
+    assert cache.lookup("Is Gi0/1 up?", [0.99, 0.05, 0.0], VERSION) == {"result": "Gi0/1 is up"}
@@ -1,32 +1,90 @@
 import logging
 import sys
-import hashlib
+import xxhash
 import re
+import string
 import os
+import tempfile
 
 def setup_logging():
-    """Configures the logging for the application."""
+    """
+    Configures the application logger once per process; repeated imports or
+    calls return the already configured logger without adding handlers.
+    """
+    logger = logging.getLogger("RAG_Chatbot")
+    if logger.handlers:
+        return logger
+
     # Ensure logs directory exists
     log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler(os.path.join(log_dir, "app.log"))
-        ]
-    )
-    return logging.getLogger("RAG_Chatbot")
+    os.makedirs(log_dir, exist_ok=True)
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        # delay=True: the file is only opened when the first record is written
+        logging.FileHandler(os.path.join(log_dir, "app.log"), delay=True)
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    logger.setLevel(logging.INFO)
+    logger.propagate = False # Don't emit every record a second time via root
+    return logger
 
 logger = setup_logging()
 
 def compute_file_hash(file_bytes):
-    """Computes SHA256 hash of file content for deduplication."""
-    return hashlib.sha256(file_bytes).hexdigest()
+    """
+    Computes a 128-bit xxHash3 of file content for deduplication.
+    This is a dedup key, not a security boundary, so a fast non-cryptographic hash is enough.
+    """
+    return xxhash.xxh3_128_hexdigest(file_bytes)
+
+def normalize_block_text(text):
+    """Strips trailing whitespace per line and collapses runs of spaces."""
+    return "\n".join(re.sub(r"[ \t]+", " ", line.rstrip()) for line in text.strip().splitlines())
+
+def compute_content_hash(text):
+    """
+    64-bit xxHash3 fingerprint of a normalized config block, as a hex string
+    (Chroma metadata ints are signed 64-bit, so the unsigned digest can't be stored as int).
+    """
+    return xxhash.xxh3_64_hexdigest(normalize_block_text(text).encode("utf-8"))
+
+class _FilenameTable(dict):
+    """str.translate table for clean_filename: any code point not listed maps to '_'."""
+    def __missing__(self, codepoint):
+        return "_"
+
+# Built once: whitelisted ASCII maps to itself, the rest of ASCII to '_' (non-ASCII via __missing__)
+_FILENAME_CHARS = frozenset(string.ascii_letters + string.digits + "._-")
+_FILENAME_TABLE = _FilenameTable((i, chr(i) if chr(i) in _FILENAME_CHARS else "_") for i in range(128))
 
 def clean_filename(filename):
-    """Sanitizes filenames."""
-    return re.sub(r'[^a-zA-Z0-9._-]', '_', filename)
+    """Sanitizes filenames (every character outside [a-zA-Z0-9._-] becomes '_')."""
+    return filename.translate(_FILENAME_TABLE)
+
+def persist_upload(uploaded_file, upload_dir="./uploads"):
+    """
+    Saves an uploaded file under its content hash (content-addressed storage).
+    The hash is taken from the upload's in-memory buffer (a zero-copy memoryview),
+    and the file is only written when that path doesn't exist yet, so Streamlit
+    reruns never touch the disk. Identical bytes end up in one file, whatever
+    their name, role or session.
+    Returns (save_path, file_hash).
+    """
+    ext = os.path.splitext(clean_filename(uploaded_file.name))[1]
+    buffer = uploaded_file.getbuffer()
+    file_hash = compute_file_hash(buffer)
+    save_path = os.path.join(upload_dir, f"{file_hash}{ext}")
+
+    if not os.path.exists(save_path):
+        os.makedirs(upload_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=upload_dir, suffix=".partial", delete=False) as tmp:
+            tmp.write(buffer)
+        # Atomic rename so concurrent sessions never see a partial file
+        os.replace(tmp.name, save_path)
+
+    return save_path, file_hash
@@ -1,6 +1,7 @@
 
 import os
 import shutil
+import tempfile
 from chat_logic import RAGChatbot
 
 # Clean up previous runs
@@ -11,21 +12,23 @@ if os.path.exists("./chroma_db"):
 DIRTY_CONTENT = "hostname OLD_ROUTER_SHOULD_NOT_SEE_THIS"
 CLEAN_CONTENT = "hostname CORRECT_SWITCH"
 
-with open("dirty.cfg", "w") as f: f.write(DIRTY_CONTENT)
-with open("clean_g.cfg", "w") as f: f.write(CLEAN_CONTENT)
-with open("clean_c.cfg", "w") as f: f.write(CLEAN_CONTENT)
-
 # Initialize
 bot = RAGChatbot(model_name="llama3.2:3b")
 
 # 2. Pollute DB with 'dirty.cfg' as Candidate
+# (through the disk path, in a tmpfs scratch dir when available)
 print("Ingesting Pollutant...")
-bot.process_file("dirty.cfg", extra_metadata={"config_role": "candidate"})
+with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as tmp_dir:
+    dirty_path = os.path.join(tmp_dir, "dirty.cfg")
+    with open(dirty_path, "w") as f: f.write(DIRTY_CONTENT)
+    bot.process_file(dirty_path, extra_metadata={"config_role": "candidate"})
 
 # 3. Ingest Actual Files
 print("Ingesting Clean Files...")
-bot.process_file("clean_g.cfg", extra_metadata={"config_role": "golden"})
-bot.process_file("clean_c.cfg", extra_metadata={"config_role": "candidate"})
+bot.process_contents([
+    (CLEAN_CONTENT, "clean_g.cfg", {"config_role": "golden"}),
+    (CLEAN_CONTENT, "clean_c.cfg", {"config_role": "candidate"})
+])
 
 # 4. Compare with Strict Filenames
 query = "Compare 'clean_c.cfg' against 'clean_g.cfg'."
@@ -52,7 +55,3 @@ if found_dirty:
 else:
     print("✅ SUCCESS: Only cleaned files retrieved.")
 
-# Cleanup
-os.remove("dirty.cfg")
-os.remove("clean_g.cfg")
-os.remove("clean_c.cfg")
@@ -24,22 +24,15 @@ router ospf 1
  network 10.0.0.0 0.0.0.255 area 0
 """
 
-# Save dummy files
-with open("golden.cfg", "w") as f:
-    f.write(cfg_content)
-
-with open("candidate.cfg", "w") as f:
-    f.write(cfg_content)
-
 # Initialize Chatbot
 bot = RAGChatbot(model_name="llama3.2:3b")
 
-# Process Files
-print("Processing Golden Config...")
-bot.process_file("golden.cfg", extra_metadata={"config_role": "golden"})
-
-print("Processing Candidate Config...")
-bot.process_file("candidate.cfg", extra_metadata={"config_role": "candidate"})
+# Process Configs in memory (one batched embedding pass for both)
+print("Processing Golden and Candidate Configs...")
+bot.process_contents([
+    (cfg_content, "golden.cfg", {"config_role": "golden"}),
+    (cfg_content, "candidate.cfg", {"config_role": "candidate"})
+])
 
 # Run Quick Comparison (Standard Retrieval)
 query = "Compare 'candidate.cfg' against 'golden.cfg'."
@@ -61,7 +54,3 @@ if golden_count == 0 or candidate_count == 0:
     print("🚨 STARVATION DETECTED! One context is empty.")
 else:
     print("✅ Balance looks okay.")
-
-# Cleanup
-os.remove("golden.cfg")
-os.remove("candidate.cfg")